@@ -14,14 +14,19 @@ from ..monitoring import ServerMonitor, PerformanceMonitor, SecurityMonitor, Bus
 from ..analytics import DataProcessor, MetricsCalculator, ReportGenerator
 from ..dashboards import RealtimeDashboard, BusinessDashboard, AdminDashboard
 from ..alerts import AlertManager
-from ..privacy import PrivacyComplianceChecker
+from ..privacy import PrivacyComplianceChecker, AuditLogger
 from .middleware import PrivacyMiddleware, RateLimitMiddleware
 from .schemas import *
 from logger import logger
 
 
-def create_api_routes(app: FastAPI):
-    """Создание API маршрутов"""
+def create_api_routes(app: FastAPI, performance_monitor: Optional[PerformanceMonitor] = None):
+    """Создание API маршрутов
+    
+    performance_monitor — монитор, метрики которого уже собирает вызывающий
+    (цикл мониторинга роутера): API только читает его сводку и не запускает
+    второй сбор с теми же внешними проверками
+    """
     
     # Добавляем middleware
     app.add_middleware(
@@ -37,7 +42,11 @@ def create_api_routes(app: FastAPI):
     
     # Инициализируем компоненты
     server_monitor = ServerMonitor()
-    performance_monitor = PerformanceMonitor()
+    # Сбором метрик каждого монитора владеет кто-то один: свой монитор API
+    # запускает и останавливает само, переданный — нет
+    owns_performance_monitor = performance_monitor is None
+    if owns_performance_monitor:
+        performance_monitor = PerformanceMonitor()
     security_monitor = SecurityMonitor()
     business_monitor = BusinessMonitor()
     data_processor = DataProcessor()
@@ -48,6 +57,28 @@ def create_api_routes(app: FastAPI):
     admin_dashboard = AdminDashboard()
     alert_manager = AlertManager()
     privacy_checker = PrivacyComplianceChecker()
+    # Общий логгер аудита приложения: доступен обработчикам через app.state,
+    # при остановке дописывает события из очереди
+    audit_logger = AuditLogger()
+    app.state.audit_logger = audit_logger
+    
+    @app.on_event("startup")
+    async def start_background_monitors():
+        """Запуск фонового обновления метрик"""
+        if settings.MONITORING_ENABLED:
+            await business_monitor.start(settings.BUSINESS_METRICS_INTERVAL)
+            if owns_performance_monitor:
+                await performance_monitor.start(settings.PERFORMANCE_METRICS_INTERVAL)
+    
+    @app.on_event("shutdown")
+    async def stop_background_monitors():
+        """Остановка фонового обновления метрик"""
+        await business_monitor.stop()
+        if owns_performance_monitor:
+            await performance_monitor.stop()
+        await security_monitor.stop()
+        await server_monitor.stop()
+        await audit_logger.stop()
     
     # ========================================
     # 📊 МОНИТОРИНГ
@@ -61,7 +92,7 @@ def create_api_routes(app: FastAPI):
             status_list = []
             
             for server in servers:
-                status_data = await server_monitor.get_server_summary(server['id'])
+                status_data = server_monitor.get_server_summary(server['id'])
                 status_list.append(ServerStatusResponse(**status_data))
             
             return status_list
@@ -202,6 +202,7 @@ async def example_privacy():
     # Аудит
     audit_logger = AuditLogger()
     await audit_logger.log_data_access("user_profile", "user123", ["personal_data"], "analytics")
+    await audit_logger.stop()
     print("Событие аудита зарегистрировано")
 
 
@@ -322,6 +323,7 @@ async def example_integration():
     
     # 6. Логируем аудит
     await audit_logger.log_data_access("analytics", "user123", ["analytics_data"], "reporting")
+    await audit_logger.stop()
     
     print("Интеграция завершена успешно")
     print(f"KPI: {kpis}")
@@ -0,0 +1,38 @@
+"""
+Общие вспомогательные функции мониторов
+"""
+
+from functools import wraps
+from typing import Any, List
+
+from logger import logger
+
+
+def copy_default(default: Any) -> Any:
+    """Копия изменяемого значения по умолчанию, чтобы не раздавать общий объект"""
+    return default.copy() if hasattr(default, "copy") else default
+
+
+def harden(results: List[Any], defaults: tuple, context: str, monitor: str) -> List[Any]:
+    """Замена исключений из asyncio.gather значениями по умолчанию"""
+    hardened = []
+    for result, default in zip(results, defaults):
+        if isinstance(result, Exception):
+            logger.error(f"[{monitor}] Ошибка получения ({context}): {result}")
+            result = copy_default(default)
+        hardened.append(result)
+    return hardened
+
+
+def safe_async(default: Any, monitor: str):
+    """Декоратор метода: при исключении логирует ошибку и возвращает значение по умолчанию"""
+    def decorator(func):
+        @wraps(func)
+        async def wrapper(self, *args, **kwargs):
+            try:
+                return await func(self, *args, **kwargs)
+            except Exception as e:
+                logger.error(f"[{monitor}] Ошибка в {func.__name__}: {e}")
+                return copy_default(default)
+        return wrapper
+    return decorator
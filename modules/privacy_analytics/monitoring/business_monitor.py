@@ -3,39 +3,256 @@
 """
 
 import asyncio
-from datetime import datetime, timedelta
-from typing import Dict, List, Any, Optional
+import operator
+import random
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Any, Optional, TypedDict
+
+import numpy as np
+import orjson
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import async_session_maker
 
 from .. import settings
 from ..privacy import PrivacyComplianceChecker
+from ._util import harden, safe_async
 from logger import logger
 
+# Имя монитора в сообщениях лога
+_MONITOR = "Business Monitor"
+
+
+# Порядок элементов в массивах метрик по тарифам и источникам
+TARIFFS = ("1_month", "3_months", "6_months", "12_months")
+SOURCES = ("telegram_ads", "referral", "organic", "direct")
+
+
+class UserMetrics(TypedDict):
+    """Метрики пользователей"""
+    total_users: int
+    active_users: int
+    new_users_today: int
+    new_users_this_week: int
+    new_users_this_month: int
+    retention_rate_percent: float
+    churn_rate_percent: float
+    user_growth_rate: float
+
+
+class RevenueMetrics(TypedDict):
+    """Метрики выручки"""
+    daily_revenue: float
+    weekly_revenue: float
+    monthly_revenue: float
+    revenue_growth_percent: float
+    revenue_by_tariff: np.ndarray
+    average_receipt: float
+    revenue_per_user: float
+
+
+class SubscriptionMetrics(TypedDict):
+    """Метрики подписок"""
+    total_subscriptions: int
+    active_subscriptions: int
+    new_subscriptions_today: int
+    new_subscriptions_this_week: int
+    renewal_rate_percent: float
+    cancellation_rate_percent: float
+    average_subscription_duration: float
+
+
+class ConversionMetrics(TypedDict):
+    """Метрики конверсии"""
+    overall_conversion_rate: float
+    conversion_by_source: np.ndarray
+    conversion_by_tariff: np.ndarray
+    conversion_funnel: Dict[str, int]
+    trial_to_paid_conversion: float
+
+
+# Поля сводки и соответствующие им ключи плоской схемы метрик
+SUMMARY_KEYS = (
+    "total_users",
+    "active_users",
+    "daily_revenue",
+    "monthly_revenue",
+    "conversion_rate",
+    "retention_rate"
+)
+_SUMMARY_SOURCES = (
+    "user.total_users",
+    "user.active_users",
+    "revenue.daily_revenue",
+    "revenue.monthly_revenue",
+    "conversion.overall_conversion_rate",
+    "user.retention_rate_percent"
+)
+
+
+# Диапазоны тестовых значений: (метрика, минимум, максимум, знаков после запятой).
+# Для целых метрик границы включительные, как у random.randint.
+_STUB_RANGES = (
+    ("total_users", 1000, 5000, 0),
+    ("active_users", 200, 800, 0),
+    ("new_users_today", 5, 25, 0),
+    ("new_users_week", 30, 150, 0),
+    ("new_users_month", 100, 500, 0),
+    ("retention_rate", 75, 90, 2),
+    ("churn_rate", 5, 15, 2),
+    ("user_growth_rate", 5, 25, 2),
+    ("daily_revenue", 10000, 50000, 2),
+    ("weekly_revenue", 70000, 350000, 2),
+    ("monthly_revenue", 300000, 1500000, 2),
+    ("revenue_growth", -5, 30, 2),
+    ("revenue_1_month", 10000, 30000, 2),
+    ("revenue_3_months", 20000, 50000, 2),
+    ("revenue_6_months", 15000, 40000, 2),
+    ("revenue_12_months", 10000, 30000, 2),
+    ("average_receipt", 500, 2000, 2),
+    ("revenue_per_user", 100, 500, 2),
+    ("total_subscriptions", 500, 2000, 0),
+    ("active_subscriptions", 300, 1200, 0),
+    ("new_subscriptions_today", 2, 15, 0),
+    ("new_subscriptions_week", 10, 80, 0),
+    ("new_subscriptions_month", 40, 300, 0),
+    ("renewal_rate", 70, 85, 2),
+    ("renewals_today", 5, 20, 0),
+    ("renewals_week", 30, 100, 0),
+    ("cancellation_rate", 5, 15, 2),
+    ("cancellations_today", 1, 8, 0),
+    ("cancellations_week", 5, 30, 0),
+    ("average_subscription_duration", 30, 120, 2),
+    ("overall_conversion", 2, 8, 2),
+    ("conversion_telegram_ads", 3, 10, 2),
+    ("conversion_referral", 5, 15, 2),
+    ("conversion_organic", 1, 5, 2),
+    ("conversion_direct", 2, 8, 2),
+    ("conversion_1_month", 2, 6, 2),
+    ("conversion_3_months", 3, 8, 2),
+    ("conversion_6_months", 4, 10, 2),
+    ("conversion_12_months", 5, 12, 2),
+    ("funnel_visitors", 1000, 5000, 0),
+    ("funnel_registrations", 100, 500, 0),
+    ("funnel_trials", 50, 200, 0),
+    ("funnel_paid_subscriptions", 20, 100, 0),
+    ("trial_to_paid_conversion", 15, 35, 2),
+)
+
 
 class BusinessMonitor:
     """Мониторинг бизнес-метрик с соблюдением приватности"""
     
+    # Индекс метрики в пакете значений
+    _STUB_INDEX = {name: idx for idx, (name, *_) in enumerate(_STUB_RANGES)}
+    # Целые метрики тянем из [low - 0.5, high + 0.5) и округляем до 0 знаков,
+    # что дает равномерное распределение по [low, high] как у randint
+    _LOWS = np.array([low - 0.5 if digits == 0 else low for _, low, _, digits in _STUB_RANGES], dtype=np.float64)
+    _HIGHS = np.array([high + 0.5 if digits == 0 else high for _, _, high, digits in _STUB_RANGES], dtype=np.float64)
+    _ROUNDS = np.array([10.0 ** digits for *_, digits in _STUB_RANGES], dtype=np.float64)
+    
+    # Значения по умолчанию в порядке вызовов asyncio.gather
+    _GROUP_DEFAULTS = ({}, {}, {}, {})
+    _USER_DEFAULTS = (0, 0, {}, 0.0, 0.0, 0.0)
+    _REVENUE_DEFAULTS = (0.0, 0.0, 0.0, 0.0, np.zeros(len(TARIFFS)), 0.0, 0.0)
+    _SUBSCRIPTION_DEFAULTS = (0, 0, {}, {}, {}, 0.0)
+    _CONVERSION_DEFAULTS = (0.0, np.zeros(len(SOURCES)), np.zeros(len(TARIFFS)), {}, 0.0)
+    
+    # Все поля сводки одним вызовом на C-уровне
+    _summary_getter = operator.itemgetter(*_SUMMARY_SOURCES)
+    
     def __init__(self):
         self.privacy_checker = PrivacyComplianceChecker()
         self.business_cache = {}
+        self._rng = np.random.default_rng()
+        self._stub_values = None
+        self._summary = None
+        self._snapshot_mono: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+    
+    def _refresh_stub_values(self):
+        """Генерация всех тестовых значений цикла одним векторным вызовом"""
+        values = self._rng.uniform(self._LOWS, self._HIGHS)
+        self._stub_values = np.round(values * self._ROUNDS) / self._ROUNDS
+    
+    def _draw(self, metric: str) -> float:
+        """Тестовое значение метрики из пакета текущего цикла"""
+        if self._stub_values is None:
+            self._refresh_stub_values()
+        return float(self._stub_values[self._STUB_INDEX[metric]])
+    
+    @staticmethod
+    async def _gather(session: Optional[AsyncSession], *coros) -> List[Any]:
+        """Сбор результатов с исключениями вместо ошибок, как asyncio.gather(return_exceptions=True).
         
+        Без общей сессии вызовы идут параллельно; с ней — по очереди,
+        так как сессия не допускает одновременных запросов
+        """
+        if session is None:
+            return await asyncio.gather(*coros, return_exceptions=True)
+        results = []
+        for coro in coros:
+            try:
+                results.append(await coro)
+            except Exception as e:
+                results.append(e)
+        return results
+        
+    async def start(self, interval: float = settings.BUSINESS_METRICS_INTERVAL):
+        """Запуск фонового обновления бизнес-метрик"""
+        if self._task and not self._task.done():
+            return
+        self._task = asyncio.create_task(self._refresh_loop(interval))
+    
+    async def stop(self):
+        """Остановка фонового обновления бизнес-метрик"""
+        if not self._task:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+    
+    async def _refresh_loop(self, interval: float):
+        """Периодический сбор метрик; чтения обслуживаются из кэша"""
+        while True:
+            await self.collect_business_metrics()
+            # Джиттер ±10%, чтобы обновления разных экземпляров не совпадали
+            await asyncio.sleep(interval * (0.9 + 0.2 * random.random()))
+    
     async def collect_business_metrics(self):
         """Сбор бизнес-метрик"""
         try:
-            # Метрики пользователей
-            user_metrics = await self.get_user_metrics()
-            
-            # Метрики выручки
-            revenue_metrics = await self.get_revenue_metrics()
-            
-            # Метрики подписок
-            subscription_metrics = await self.get_subscription_metrics()
-            
-            # Метрики конверсии
-            conversion_metrics = await self.get_conversion_metrics()
+            # Одно чтение часов на весь цикл
+            now = time.time()
+            
+            # Все тестовые значения цикла генерируем одним пакетом
+            self._refresh_stub_values()
+            
+            # Одна сессия и одна транзакция на весь цикл: одно подключение из пула
+            # и согласованный срез данных для всех метрик. Соединение берется из пула
+            # при первом запросе. Сессия не допускает одновременных запросов,
+            # поэтому внутри нее группы и метрики собираются последовательно (_gather)
+            async with async_session_maker() as session, session.begin():
+                # Упавшая группа не срывает цикл
+                results = await self._gather(
+                    session,
+                    self.get_user_metrics(session),
+                    self.get_revenue_metrics(session),
+                    self.get_subscription_metrics(session),
+                    self.get_conversion_metrics(session)
+                )
+            
+            user_metrics, revenue_metrics, subscription_metrics, conversion_metrics = harden(
+                results, self._GROUP_DEFAULTS, "группы метрик", _MONITOR
+            )
             
             # Объединяем все метрики
             metrics = {
-                "timestamp": datetime.utcnow().isoformat(),
+                "timestamp": datetime.fromtimestamp(now, tz=timezone.utc).isoformat(),
                 "user_metrics": user_metrics,
                 "revenue_metrics": revenue_metrics,
                 "subscription_metrics": subscription_metrics,
@@ -43,17 +260,38 @@ class BusinessMonitor:
             }
             
             # Проверяем соответствие требованиям приватности
-            if not self.privacy_checker.validate_metrics(metrics):
+            if not await self.privacy_checker.validate_metrics(metrics):
                 logger.warning("[Business Monitor] Бизнес-метрики не прошли проверку приватности")
                 return
             
             # Сохраняем метрики
             await self.store_business_metrics(metrics)
             
+            # Плоская схема "группа.метрика": одно обращение к словарю на метрику
+            # Поля сводки заполнены нулями заранее, чтобы itemgetter не падал на пропусках
+            flat = dict.fromkeys(_SUMMARY_SOURCES, 0)
+            for prefix, group in (
+                ("user", user_metrics),
+                ("revenue", revenue_metrics),
+                ("subscription", subscription_metrics),
+                ("conversion", conversion_metrics)
+            ):
+                for key, value in group.items():
+                    flat[f"{prefix}.{key}"] = value
+            
             # Кэшируем для быстрого доступа
             self.business_cache = {
                 "data": metrics,
-                "timestamp": datetime.utcnow()
+                "flat": flat,
+                "timestamp": now
+            }
+            self._snapshot_mono = time.monotonic()
+            
+            # Сводку строим при записи, чтобы чтение было без вычислений
+            self._summary = {
+                "status": "ok",
+                "last_update": metrics["timestamp"],
+                **dict(zip(SUMMARY_KEYS, self._summary_getter(flat)))
             }
             
             logger.debug("[Business Monitor] Бизнес-метрики собраны успешно")
@@ -61,23 +299,23 @@ class BusinessMonitor:
         except Exception as e:
             logger.error(f"[Business Monitor] Ошибка сбора бизнес-метрик: {e}")
     
-    async def get_user_metrics(self) -> Dict[str, Any]:
+    async def get_user_metrics(self, session: Optional[AsyncSession] = None) -> UserMetrics:
         """Получение метрик пользователей (анонимизированно)"""
         try:
-            # Общее количество пользователей
-            total_users = await self.get_total_users()
-            
-            # Активные пользователи
-            active_users = await self.get_active_users()
-            
-            # Новые пользователи за период
-            new_users = await self.get_new_users()
-            
-            # Удержание пользователей
-            retention_rate = await self.get_retention_rate()
-            
-            # Отток пользователей
-            churn_rate = await self.get_churn_rate()
+            (total_users, active_users, new_users,
+             retention_rate, churn_rate, growth_rate) = harden(
+                await self._gather(
+                    session,
+                    self.get_total_users(session),
+                    self.get_active_users(session),
+                    self.get_new_users(session),
+                    self.get_retention_rate(session),
+                    self.get_churn_rate(session),
+                    self.get_user_growth_rate(session)
+                ),
+                self._USER_DEFAULTS,
+                "метрики пользователей", _MONITOR
+            )
             
             return {
                 "total_users": total_users,
@@ -87,29 +325,31 @@ class BusinessMonitor:
                 "new_users_this_month": new_users.get("month", 0),
                 "retention_rate_percent": retention_rate,
                 "churn_rate_percent": churn_rate,
-                "user_growth_rate": await self.get_user_growth_rate()
+                "user_growth_rate": growth_rate
             }
             
         except Exception as e:
             logger.error(f"[Business Monitor] Ошибка получения метрик пользователей: {e}")
             return {}
     
-    async def get_revenue_metrics(self) -> Dict[str, Any]:
+    async def get_revenue_metrics(self, session: Optional[AsyncSession] = None) -> RevenueMetrics:
         """Получение метрик выручки"""
         try:
-            # Выручка за разные периоды
-            daily_revenue = await self.get_daily_revenue()
-            weekly_revenue = await self.get_weekly_revenue()
-            monthly_revenue = await self.get_monthly_revenue()
-            
-            # Рост выручки
-            revenue_growth = await self.get_revenue_growth()
-            
-            # Выручка по тарифам
-            revenue_by_tariff = await self.get_revenue_by_tariff()
-            
-            # Средний чек
-            average_receipt = await self.get_average_receipt()
+            (daily_revenue, weekly_revenue, monthly_revenue, revenue_growth,
+             revenue_by_tariff, average_receipt, revenue_per_user) = harden(
+                await self._gather(
+                    session,
+                    self.get_daily_revenue(session),
+                    self.get_weekly_revenue(session),
+                    self.get_monthly_revenue(session),
+                    self.get_revenue_growth(session),
+                    self.get_revenue_by_tariff(session),
+                    self.get_average_receipt(session),
+                    self.get_revenue_per_user(session)
+                ),
+                self._REVENUE_DEFAULTS,
+                "метрики выручки", _MONITOR
+            )
             
             return {
                 "daily_revenue": daily_revenue,
@@ -118,30 +358,30 @@ class BusinessMonitor:
                 "revenue_growth_percent": revenue_growth,
                 "revenue_by_tariff": revenue_by_tariff,
                 "average_receipt": average_receipt,
-                "revenue_per_user": await self.get_revenue_per_user()
+                "revenue_per_user": revenue_per_user
             }
             
         except Exception as e:
             logger.error(f"[Business Monitor] Ошибка получения метрик выручки: {e}")
             return {}
     
-    async def get_subscription_metrics(self) -> Dict[str, Any]:
+    async def get_subscription_metrics(self, session: Optional[AsyncSession] = None) -> SubscriptionMetrics:
         """Получение метрик подписок"""
         try:
-            # Общее количество подписок
-            total_subscriptions = await self.get_total_subscriptions()
-            
-            # Активные подписки
-            active_subscriptions = await self.get_active_subscriptions()
-            
-            # Новые подписки
-            new_subscriptions = await self.get_new_subscriptions()
-            
-            # Продления подписок
-            renewals = await self.get_subscription_renewals()
-            
-            # Отмены подписок
-            cancellations = await self.get_subscription_cancellations()
+            (total_subscriptions, active_subscriptions, new_subscriptions,
+             renewals, cancellations, average_duration) = harden(
+                await self._gather(
+                    session,
+                    self.get_total_subscriptions(session),
+                    self.get_active_subscriptions(session),
+                    self.get_new_subscriptions(session),
+                    self.get_subscription_renewals(session),
+                    self.get_subscription_cancellations(session),
+                    self.get_average_subscription_duration(session)
+                ),
+                self._SUBSCRIPTION_DEFAULTS,
+                "метрики подписок", _MONITOR
+            )
             
             return {
                 "total_subscriptions": total_subscriptions,
@@ -150,368 +390,226 @@ class BusinessMonitor:
                 "new_subscriptions_this_week": new_subscriptions.get("week", 0),
                 "renewal_rate_percent": renewals.get("rate", 0),
                 "cancellation_rate_percent": cancellations.get("rate", 0),
-                "average_subscription_duration": await self.get_average_subscription_duration()
+                "average_subscription_duration": average_duration
             }
             
         except Exception as e:
             logger.error(f"[Business Monitor] Ошибка получения метрик подписок: {e}")
             return {}
     
-    async def get_conversion_metrics(self) -> Dict[str, Any]:
+    async def get_conversion_metrics(self, session: Optional[AsyncSession] = None) -> ConversionMetrics:
         """Получение метрик конверсии"""
         try:
-            # Общая конверсия
-            overall_conversion = await self.get_overall_conversion_rate()
-            
-            # Конверсия по источникам
-            conversion_by_source = await self.get_conversion_by_source()
-            
-            # Конверсия по тарифам
-            conversion_by_tariff = await self.get_conversion_by_tariff()
-            
-            # Воронка конверсии
-            conversion_funnel = await self.get_conversion_funnel()
+            (overall_conversion, conversion_by_source, conversion_by_tariff,
+             conversion_funnel, trial_to_paid) = harden(
+                await self._gather(
+                    session,
+                    self.get_overall_conversion_rate(session),
+                    self.get_conversion_by_source(session),
+                    self.get_conversion_by_tariff(session),
+                    self.get_conversion_funnel(session),
+                    self.get_trial_to_paid_conversion(session)
+                ),
+                self._CONVERSION_DEFAULTS,
+                "метрики конверсии", _MONITOR
+            )
             
             return {
                 "overall_conversion_rate": overall_conversion,
                 "conversion_by_source": conversion_by_source,
                 "conversion_by_tariff": conversion_by_tariff,
                 "conversion_funnel": conversion_funnel,
-                "trial_to_paid_conversion": await self.get_trial_to_paid_conversion()
+                "trial_to_paid_conversion": trial_to_paid
             }
             
         except Exception as e:
             logger.error(f"[Business Monitor] Ошибка получения метрик конверсии: {e}")
             return {}
     
-    async def get_total_users(self) -> int:
+    @safe_async(0, _MONITOR)
+    async def get_total_users(self, session: Optional[AsyncSession] = None) -> int:
         """Получение общего количества пользователей"""
-        try:
-            # Здесь должна быть логика получения из базы данных
-            import random
-            return random.randint(1000, 5000)
-            
-        except Exception as e:
-            logger.error(f"[Business Monitor] Ошибка получения общего количества пользователей: {e}")
-            return 0
+        # Здесь должна быть логика получения из базы данных
+        return int(self._draw("total_users"))
     
-    async def get_active_users(self) -> int:
+    @safe_async(0, _MONITOR)
+    async def get_active_users(self, session: Optional[AsyncSession] = None) -> int:
         """Получение количества активных пользователей"""
-        try:
-            # Здесь должна быть логика получения из базы данных
-            import random
-            return random.randint(200, 800)
-            
-        except Exception as e:
-            logger.error(f"[Business Monitor] Ошибка получения активных пользователей: {e}")
-            return 0
+        # Здесь должна быть логика получения из базы данных
+        return int(self._draw("active_users"))
     
-    async def get_new_users(self) -> Dict[str, int]:
+    @safe_async({}, _MONITOR)
+    async def get_new_users(self, session: Optional[AsyncSession] = None) -> Dict[str, int]:
         """Получение количества новых пользователей за периоды"""
-        try:
-            # Здесь должна быть логика получения из базы данных
-            import random
-            return {
-                "today": random.randint(5, 25),
-                "week": random.randint(30, 150),
-                "month": random.randint(100, 500)
-            }
-            
-        except Exception as e:
-            logger.error(f"[Business Monitor] Ошибка получения новых пользователей: {e}")
-            return {}
+        # Здесь должна быть логика получения из базы данных
+        return {
+            "today": int(self._draw("new_users_today")),
+            "week": int(self._draw("new_users_week")),
+            "month": int(self._draw("new_users_month"))
+        }
     
-    async def get_retention_rate(self) -> float:
+    @safe_async(0.0, _MONITOR)
+    async def get_retention_rate(self, session: Optional[AsyncSession] = None) -> float:
         """Получение процента удержания пользователей"""
-        try:
-            # Здесь должна быть логика расчета удержания
-            import random
-            return round(random.uniform(75, 90), 2)
-            
-        except Exception as e:
-            logger.error(f"[Business Monitor] Ошибка получения удержания: {e}")
-            return 0.0
+        # Здесь должна быть логика расчета удержания
+        return self._draw("retention_rate")
     
-    async def get_churn_rate(self) -> float:
+    @safe_async(0.0, _MONITOR)
+    async def get_churn_rate(self, session: Optional[AsyncSession] = None) -> float:
         """Получение процента оттока пользователей"""
-        try:
-            # Здесь должна быть логика расчета оттока
-            import random
-            return round(random.uniform(5, 15), 2)
-            
-        except Exception as e:
-            logger.error(f"[Business Monitor] Ошибка получения оттока: {e}")
-            return 0.0
+        # Здесь должна быть логика расчета оттока
+        return self._draw("churn_rate")
     
-    async def get_user_growth_rate(self) -> float:
+    @safe_async(0.0, _MONITOR)
+    async def get_user_growth_rate(self, session: Optional[AsyncSession] = None) -> float:
         """Получение темпа роста пользователей"""
-        try:
-            # Здесь должна быть логика расчета роста
-            import random
-            return round(random.uniform(5, 25), 2)
-            
-        except Exception as e:
-            logger.error(f"[Business Monitor] Ошибка получения темпа роста: {e}")
-            return 0.0
+        # Здесь должна быть логика расчета роста
+        return self._draw("user_growth_rate")
     
-    async def get_daily_revenue(self) -> float:
+    @safe_async(0.0, _MONITOR)
+    async def get_daily_revenue(self, session: Optional[AsyncSession] = None) -> float:
         """Получение дневной выручки"""
-        try:
-            # Здесь должна быть логика получения из базы данных
-            import random
-            return round(random.uniform(10000, 50000), 2)
-            
-        except Exception as e:
-            logger.error(f"[Business Monitor] Ошибка получения дневной выручки: {e}")
-            return 0.0
+        # Здесь должна быть логика получения из базы данных
+        return self._draw("daily_revenue")
     
-    async def get_weekly_revenue(self) -> float:
+    @safe_async(0.0, _MONITOR)
+    async def get_weekly_revenue(self, session: Optional[AsyncSession] = None) -> float:
         """Получение недельной выручки"""
-        try:
-            # Здесь должна быть логика получения из базы данных
-            import random
-            return round(random.uniform(70000, 350000), 2)
-            
-        except Exception as e:
-            logger.error(f"[Business Monitor] Ошибка получения недельной выручки: {e}")
-            return 0.0
+        # Здесь должна быть логика получения из базы данных
+        return self._draw("weekly_revenue")
     
-    async def get_monthly_revenue(self) -> float:
+    @safe_async(0.0, _MONITOR)
+    async def get_monthly_revenue(self, session: Optional[AsyncSession] = None) -> float:
         """Получение месячной выручки"""
-        try:
-            # Здесь должна быть логика получения из базы данных
-            import random
-            return round(random.uniform(300000, 1500000), 2)
-            
-        except Exception as e:
-            logger.error(f"[Business Monitor] Ошибка получения месячной выручки: {e}")
-            return 0.0
+        # Здесь должна быть логика получения из базы данных
+        return self._draw("monthly_revenue")
     
-    async def get_revenue_growth(self) -> float:
+    @safe_async(0.0, _MONITOR)
+    async def get_revenue_growth(self, session: Optional[AsyncSession] = None) -> float:
         """Получение темпа роста выручки"""
-        try:
-            # Здесь должна быть логика расчета роста выручки
-            import random
-            return round(random.uniform(-5, 30), 2)
-            
-        except Exception as e:
-            logger.error(f"[Business Monitor] Ошибка получения роста выручки: {e}")
-            return 0.0
+        # Здесь должна быть логика расчета роста выручки
+        return self._draw("revenue_growth")
     
-    async def get_revenue_by_tariff(self) -> Dict[str, float]:
-        """Получение выручки по тарифам"""
-        try:
-            # Здесь должна быть логика получения из базы данных
-            import random
-            return {
-                "1_month": round(random.uniform(10000, 30000), 2),
-                "3_months": round(random.uniform(20000, 50000), 2),
-                "6_months": round(random.uniform(15000, 40000), 2),
-                "12_months": round(random.uniform(10000, 30000), 2)
-            }
-            
-        except Exception as e:
-            logger.error(f"[Business Monitor] Ошибка получения выручки по тарифам: {e}")
-            return {}
+    @safe_async(np.zeros(len(TARIFFS)), _MONITOR)
+    async def get_revenue_by_tariff(self, session: Optional[AsyncSession] = None) -> np.ndarray:
+        """Получение выручки по тарифам (элементы в порядке TARIFFS)"""
+        # Здесь должна быть логика получения из базы данных
+        return np.array([self._draw(f"revenue_{tariff}") for tariff in TARIFFS])
     
-    async def get_average_receipt(self) -> float:
+    @safe_async(0.0, _MONITOR)
+    async def get_average_receipt(self, session: Optional[AsyncSession] = None) -> float:
         """Получение среднего чека"""
-        try:
-            # Здесь должна быть логика расчета среднего чека
-            import random
-            return round(random.uniform(500, 2000), 2)
-            
-        except Exception as e:
-            logger.error(f"[Business Monitor] Ошибка получения среднего чека: {e}")
-            return 0.0
+        # Здесь должна быть логика расчета среднего чека
+        return self._draw("average_receipt")
     
-    async def get_revenue_per_user(self) -> float:
+    @safe_async(0.0, _MONITOR)
+    async def get_revenue_per_user(self, session: Optional[AsyncSession] = None) -> float:
         """Получение выручки на пользователя"""
-        try:
-            # Здесь должна быть логика расчета выручки на пользователя
-            import random
-            return round(random.uniform(100, 500), 2)
-            
-        except Exception as e:
-            logger.error(f"[Business Monitor] Ошибка получения выручки на пользователя: {e}")
-            return 0.0
+        # Здесь должна быть логика расчета выручки на пользователя
+        return self._draw("revenue_per_user")
     
-    async def get_total_subscriptions(self) -> int:
+    @safe_async(0, _MONITOR)
+    async def get_total_subscriptions(self, session: Optional[AsyncSession] = None) -> int:
         """Получение общего количества подписок"""
-        try:
-            # Здесь должна быть логика получения из базы данных
-            import random
-            return random.randint(500, 2000)
-            
-        except Exception as e:
-            logger.error(f"[Business Monitor] Ошибка получения общего количества подписок: {e}")
-            return 0
+        # Здесь должна быть логика получения из базы данных
+        return int(self._draw("total_subscriptions"))
     
-    async def get_active_subscriptions(self) -> int:
+    @safe_async(0, _MONITOR)
+    async def get_active_subscriptions(self, session: Optional[AsyncSession] = None) -> int:
         """Получение количества активных подписок"""
-        try:
-            # Здесь должна быть логика получения из базы данных
-            import random
-            return random.randint(300, 1200)
-            
-        except Exception as e:
-            logger.error(f"[Business Monitor] Ошибка получения активных подписок: {e}")
-            return 0
+        # Здесь должна быть логика получения из базы данных
+        return int(self._draw("active_subscriptions"))
     
-    async def get_new_subscriptions(self) -> Dict[str, int]:
+    @safe_async({}, _MONITOR)
+    async def get_new_subscriptions(self, session: Optional[AsyncSession] = None) -> Dict[str, int]:
         """Получение количества новых подписок за периоды"""
-        try:
-            # Здесь должна быть логика получения из базы данных
-            import random
-            return {
-                "today": random.randint(2, 15),
-                "week": random.randint(10, 80),
-                "month": random.randint(40, 300)
-            }
-            
-        except Exception as e:
-            logger.error(f"[Business Monitor] Ошибка получения новых подписок: {e}")
-            return {}
+        # Здесь должна быть логика получения из базы данных
+        return {
+            "today": int(self._draw("new_subscriptions_today")),
+            "week": int(self._draw("new_subscriptions_week")),
+            "month": int(self._draw("new_subscriptions_month"))
+        }
     
-    async def get_subscription_renewals(self) -> Dict[str, Any]:
+    @safe_async({}, _MONITOR)
+    async def get_subscription_renewals(self, session: Optional[AsyncSession] = None) -> Dict[str, Any]:
         """Получение метрик продления подписок"""
-        try:
-            # Здесь должна быть логика получения из базы данных
-            import random
-            return {
-                "rate": round(random.uniform(70, 85), 2),
-                "count_today": random.randint(5, 20),
-                "count_this_week": random.randint(30, 100)
-            }
-            
-        except Exception as e:
-            logger.error(f"[Business Monitor] Ошибка получения продлений: {e}")
-            return {}
+        # Здесь должна быть логика получения из базы данных
+        return {
+            "rate": self._draw("renewal_rate"),
+            "count_today": int(self._draw("renewals_today")),
+            "count_this_week": int(self._draw("renewals_week"))
+        }
     
-    async def get_subscription_cancellations(self) -> Dict[str, Any]:
+    @safe_async({}, _MONITOR)
+    async def get_subscription_cancellations(self, session: Optional[AsyncSession] = None) -> Dict[str, Any]:
         """Получение метрик отмены подписок"""
-        try:
-            # Здесь должна быть логика получения из базы данных
-            import random
-            return {
-                "rate": round(random.uniform(5, 15), 2),
-                "count_today": random.randint(1, 8),
-                "count_this_week": random.randint(5, 30)
-            }
-            
-        except Exception as e:
-            logger.error(f"[Business Monitor] Ошибка получения отмен: {e}")
-            return {}
+        # Здесь должна быть логика получения из базы данных
+        return {
+            "rate": self._draw("cancellation_rate"),
+            "count_today": int(self._draw("cancellations_today")),
+            "count_this_week": int(self._draw("cancellations_week"))
+        }
     
-    async def get_average_subscription_duration(self) -> float:
+    @safe_async(0.0, _MONITOR)
+    async def get_average_subscription_duration(self, session: Optional[AsyncSession] = None) -> float:
         """Получение средней продолжительности подписки"""
-        try:
-            # Здесь должна быть логика расчета продолжительности
-            import random
-            return round(random.uniform(30, 120), 2)  # дни
-            
-        except Exception as e:
-            logger.error(f"[Business Monitor] Ошибка получения продолжительности подписки: {e}")
-            return 0.0
+        # Здесь должна быть логика расчета продолжительности
+        return self._draw("average_subscription_duration")  # дни
     
-    async def get_overall_conversion_rate(self) -> float:
+    @safe_async(0.0, _MONITOR)
+    async def get_overall_conversion_rate(self, session: Optional[AsyncSession] = None) -> float:
         """Получение общей конверсии"""
-        try:
-            # Здесь должна быть логика расчета конверсии
-            import random
-            return round(random.uniform(2, 8), 2)
-            
-        except Exception as e:
-            logger.error(f"[Business Monitor] Ошибка получения общей конверсии: {e}")
-            return 0.0
+        # Здесь должна быть логика расчета конверсии
+        return self._draw("overall_conversion")
     
-    async def get_conversion_by_source(self) -> Dict[str, float]:
-        """Получение конверсии по источникам"""
-        try:
-            # Здесь должна быть логика получения из базы данных
-            import random
-            return {
-                "telegram_ads": round(random.uniform(3, 10), 2),
-                "referral": round(random.uniform(5, 15), 2),
-                "organic": round(random.uniform(1, 5), 2),
-                "direct": round(random.uniform(2, 8), 2)
-            }
-            
-        except Exception as e:
-            logger.error(f"[Business Monitor] Ошибка получения конверсии по источникам: {e}")
-            return {}
+    @safe_async(np.zeros(len(SOURCES)), _MONITOR)
+    async def get_conversion_by_source(self, session: Optional[AsyncSession] = None) -> np.ndarray:
+        """Получение конверсии по источникам (элементы в порядке SOURCES)"""
+        # Здесь должна быть логика получения из базы данных
+        return np.array([self._draw(f"conversion_{source}") for source in SOURCES])
     
-    async def get_conversion_by_tariff(self) -> Dict[str, float]:
-        """Получение конверсии по тарифам"""
-        try:
-            # Здесь должна быть логика получения из базы данных
-            import random
-            return {
-                "1_month": round(random.uniform(2, 6), 2),
-                "3_months": round(random.uniform(3, 8), 2),
-                "6_months": round(random.uniform(4, 10), 2),
-                "12_months": round(random.uniform(5, 12), 2)
-            }
-            
-        except Exception as e:
-            logger.error(f"[Business Monitor] Ошибка получения конверсии по тарифам: {e}")
-            return {}
+    @safe_async(np.zeros(len(TARIFFS)), _MONITOR)
+    async def get_conversion_by_tariff(self, session: Optional[AsyncSession] = None) -> np.ndarray:
+        """Получение конверсии по тарифам (элементы в порядке TARIFFS)"""
+        # Здесь должна быть логика получения из базы данных
+        return np.array([self._draw(f"conversion_{tariff}") for tariff in TARIFFS])
     
-    async def get_conversion_funnel(self) -> Dict[str, Any]:
+    @safe_async({}, _MONITOR)
+    async def get_conversion_funnel(self, session: Optional[AsyncSession] = None) -> Dict[str, Any]:
         """Получение воронки конверсии"""
-        try:
-            # Здесь должна быть логика расчета воронки
-            import random
-            return {
-                "visitors": random.randint(1000, 5000),
-                "registrations": random.randint(100, 500),
-                "trials": random.randint(50, 200),
-                "paid_subscriptions": random.randint(20, 100)
-            }
-            
-        except Exception as e:
-            logger.error(f"[Business Monitor] Ошибка получения воронки конверсии: {e}")
-            return {}
+        # Здесь должна быть логика расчета воронки
+        return {
+            "visitors": int(self._draw("funnel_visitors")),
+            "registrations": int(self._draw("funnel_registrations")),
+            "trials": int(self._draw("funnel_trials")),
+            "paid_subscriptions": int(self._draw("funnel_paid_subscriptions"))
+        }
     
-    async def get_trial_to_paid_conversion(self) -> float:
+    @safe_async(0.0, _MONITOR)
+    async def get_trial_to_paid_conversion(self, session: Optional[AsyncSession] = None) -> float:
         """Получение конверсии из пробной в платную подписку"""
-        try:
-            # Здесь должна быть логика расчета конверсии
-            import random
-            return round(random.uniform(15, 35), 2)
-            
-        except Exception as e:
-            logger.error(f"[Business Monitor] Ошибка получения конверсии пробной подписки: {e}")
-            return 0.0
+        # Здесь должна быть логика расчета конверсии
+        return self._draw("trial_to_paid_conversion")
     
     async def store_business_metrics(self, metrics: Dict[str, Any]):
         """Сохранение бизнес-метрик"""
         try:
-            # Здесь должна быть логика сохранения в базу данных
-            logger.debug("[Business Monitor] Сохранение бизнес-метрик")
+            # Сериализуем в C: numpy-массивы и datetime orjson кодирует сам
+            payload = orjson.dumps(
+                metrics,
+                option=orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+            )
+            
+            # Здесь должна быть логика сохранения payload в базу данных
+            logger.debug(f"[Business Monitor] Сохранение бизнес-метрик ({len(payload)} байт)")
             
         except Exception as e:
             logger.error(f"[Business Monitor] Ошибка сохранения метрик: {e}")
     
+    def is_cache_fresh(self, ttl: float = settings.CACHE_TTL_SECONDS) -> bool:
+        """Проверка возраста кэша по монотонным часам (не зависит от перевода системного времени)"""
+        return self._snapshot_mono is not None and time.monotonic() - self._snapshot_mono < ttl
+    
     async def get_business_summary(self) -> Dict[str, Any]:
         """Получение сводки по бизнес-метрикам"""
-        try:
-            if not self.business_cache:
-                return {"status": "no_data"}
-            
-            metrics = self.business_cache["data"]
-            
-            return {
-                "status": "ok",
-                "last_update": metrics["timestamp"],
-                "total_users": metrics.get("user_metrics", {}).get("total_users", 0),
-                "active_users": metrics.get("user_metrics", {}).get("active_users", 0),
-                "daily_revenue": metrics.get("revenue_metrics", {}).get("daily_revenue", 0),
-                "monthly_revenue": metrics.get("revenue_metrics", {}).get("monthly_revenue", 0),
-                "conversion_rate": metrics.get("conversion_metrics", {}).get("overall_conversion_rate", 0),
-                "retention_rate": metrics.get("user_metrics", {}).get("retention_rate_percent", 0)
-            }
-            
-        except Exception as e:
-            logger.error(f"[Business Monitor] Ошибка получения сводки: {e}")
-            return {"status": "error"}
+        return self._summary or {"status": "no_data"}
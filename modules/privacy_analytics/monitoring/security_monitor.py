@@ -3,42 +3,162 @@
 """
 
 import asyncio
+import heapq
+import json
+import os
+import random
+import socket
+import sqlite3
+import threading
 import time
 from datetime import datetime, timedelta
-from typing import Dict, List, Any, Optional
-from collections import defaultdict, deque
+from typing import Dict, List, Any, Optional, Tuple
+from collections import OrderedDict, deque
 
 from .. import settings
-from ..privacy import PrivacyComplianceChecker
+from ..privacy import PrivacyComplianceChecker, anonymize_user_id
+from ._util import harden
 from logger import logger
 
+# Имя монитора в сообщениях лога
+_MONITOR = "Security Monitor"
+
+
+# Ключ IP: адрес 128-битным целым в пространстве IPv6. IPv4 отображается
+# в диапазон IPv4-mapped (::ffff:a.b.c.d), поэтому 0.0.0.1 и ::1 не совпадают,
+# а хеш ключа — само число
+IpKey = int
+_IPV4_MAPPED = 0xFFFF << 32
+
+
+def _ip_key(ip: str) -> Optional[IpKey]:
+    """Ключ IP-адреса (IPv4 или IPv6); None для некорректного адреса"""
+    try:
+        if ":" in ip:
+            return int.from_bytes(socket.inet_pton(socket.AF_INET6, ip), "big")
+        return _IPV4_MAPPED | int.from_bytes(socket.inet_pton(socket.AF_INET, ip), "big")
+    except (OSError, TypeError):
+        return None
+
+
+def _ip_str(key: IpKey) -> str:
+    """Строковое представление IP по ключу из _ip_key"""
+    if key >> 32 == 0xFFFF:
+        return socket.inet_ntop(socket.AF_INET, (key & 0xFFFFFFFF).to_bytes(4, "big"))
+    return socket.inet_ntop(socket.AF_INET6, key.to_bytes(16, "big"))
+
 
 class SecurityMonitor:
     """Мониторинг событий безопасности"""
     
+    # Полиномиальное затухание счетов (модель MISP): (τ — время жизни в секундах, δ — форма).
+    # Через τ секунд без обновлений счет обнуляется; запись ниже порога считается угасшей
+    FAILED_LOGIN_DECAY = (3600, 0.55)
+    PRIVILEGE_DECAY = (86400, 0.3)
+    # Брутфорс: по IP — 10 попыток за час, по пользователю — 5 попыток за 5 минут
+    # (подбор пароля к одной учетной записи с множества IP)
+    BRUTE_FORCE_IP_THRESHOLD = 10
+    BRUTE_FORCE_USER_THRESHOLD = 5
+    USER_FAILED_LOGIN_DECAY = (300, 0.55)
+    FAILED_SCORE_FLOOR = 0.5
+    # Подозрительные IP затухают так же; хранится не больше SUSPICIOUS_IP_LIMIT записей
+    # (для пользователей — FAILED_USER_LIMIT), при переполнении вытесняется дольше всех
+    # не обновлявшаяся запись: поток входов со случайными логинами не раздувает таблицу
+    SUSPICIOUS_IP_LIMIT = 10000
+    FAILED_USER_LIMIT = 10000
+    ALERT_QUEUE_SIZE = 1000
+    # Пакетная запись событий: размер очереди и максимальное ожидание добора пакета (секунды)
+    EVENT_QUEUE_SIZE = 1000
+    EVENT_BATCH_WAIT = 1.0
+    EVENT_POLL_INTERVAL = 0.05
+    # Сколько секунд результат детекции угроз переиспользуется без пересчета
+    THREAT_CACHE_TTL = 5.0
+    
+    # Значения по умолчанию для параллельно собираемых результатов, по позициям
+    _GROUP_DEFAULTS = ({}, {}, {})
+    _THREAT_DEFAULTS = ({}, {}, {}, {})
+    _ACCESS_DEFAULTS = (0, 0, 0, {})
+    _DATA_PROTECTION_DEFAULTS = (0, 0, 0, {})
+    
     def __init__(self):
         self.privacy_checker = PrivacyComplianceChecker()
-        self.security_events = deque(maxlen=10000)
-        self.failed_logins = defaultdict(list)
-        self.suspicious_ips = defaultdict(int)
-        self.privilege_attempts = deque(maxlen=1000)
-        self.unauthorized_access = deque(maxlen=1000)
+        # В памяти только идентификаторы последних сохраненных событий, сами события — в SQLite
+        self.security_events: deque = deque(maxlen=10000)
+        self._db: Optional[sqlite3.Connection] = None
+        # Соединение используется из потоков asyncio.to_thread: открытие, запросы
+        # и закрытие — только под блокировкой
+        self._db_lock = threading.Lock()
+        # Все отметки времени — по монотонным часам, не зависящим от перевода системного времени
+        # Затухающий счет неудачных входов по IP: ключ IP -> (счет, время последнего обновления).
+        # IP хранятся ключами _ip_key (целое число): компактнее и дешевле строки
+        self.failed_scores: Dict[IpKey, Tuple[float, float]] = {}
+        # То же по пользователю в порядке последнего обновления: анонимный ID
+        # пользователя -> (счет, время); логины (часто email) в монитор не попадают
+        self.failed_by_user: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        # Затухающий счет подозрительной активности по IP в порядке последнего обновления
+        self.suspicious_ips: "OrderedDict[IpKey, Tuple[float, float]]" = OrderedDict()
+        # Затухающие счетчики эскалации привилегий и несанкционированного доступа: (счет, время)
+        self.privilege_attempts: Tuple[float, float] = (0.0, time.monotonic())
+        self.unauthorized_access: Tuple[float, float] = (0.0, time.monotonic())
+        # Генератор тестовых значений для заглушек, один на монитор
+        self._rng = random.Random()
+        # Очередь алертов: отправка уведомлений не задерживает цикл мониторинга
+        self._alert_q: asyncio.Queue = asyncio.Queue(maxsize=self.ALERT_QUEUE_SIZE)
+        self._alert_task: Optional[asyncio.Task] = None
+        # Очередь записи событий в базу: пишутся пакетами по размеру или по времени
+        self._write_q: asyncio.Queue = asyncio.Queue(maxsize=self.EVENT_QUEUE_SIZE)
+        self._writer_task: Optional[asyncio.Task] = None
+        # Подряд идущие одинаковые события не пишутся заново: считаем повторы
+        # и записываем их одной сводной строкой, когда картина меняется
+        self._last_event_signature: Optional[int] = None
+        self._last_event_timestamp: Optional[str] = None
+        self._repeat_count = 0
+        self._repeat_last_seen: Optional[str] = None
+        # Последний результат детекции угроз: (момент расчета, результат, время расчета ISO)
+        self._threat_cache: Optional[Tuple[float, Dict[str, Any], str]] = None
+        
+    async def stop(self):
+        """Остановка фоновых задач после обработки уже поставленных в очередь алертов и событий"""
+        self._enqueue_repeats()
+        if self._writer_task:
+            self._writer_task.cancel()
+            try:
+                await self._writer_task
+            except asyncio.CancelledError:
+                pass
+            self._writer_task = None
+        await self.flush_security_events()
+        await asyncio.to_thread(self._close_db)
         
+        if not self._alert_task or self._alert_task.done():
+            return
+        # Метка завершения встает в конец очереди, поэтому ожидающие алерты успеют уйти
+        await self._alert_q.put(None)
+        await self._alert_task
+        self._alert_task = None
+    
     async def monitor_security_events(self):
         """Мониторинг событий безопасности"""
         try:
-            # Детекция угроз
-            threat_events = await self.detect_threats()
-            
-            # Контроль доступа
-            access_events = await self.monitor_access_control()
-            
-            # Защита данных
-            data_protection_events = await self.monitor_data_protection()
+            # Одна отметка времени на весь цикл: для событий и кэша угроз
+            timestamp = datetime.utcnow().isoformat()
+            
+            # Группы независимы, собираем их параллельно. Детекцию угроз цикл
+            # мониторинга всегда считает заново и обновляет кэш
+            threat_events, access_events, data_protection_events = harden(
+                await asyncio.gather(
+                    self.detect_threats(force=True, timestamp=timestamp),
+                    self.monitor_access_control(),
+                    self.monitor_data_protection(),
+                    return_exceptions=True
+                ),
+                self._GROUP_DEFAULTS,
+                "группы событий", _MONITOR
+            )
             
             # Объединяем все события
             security_events = {
-                "timestamp": datetime.utcnow().isoformat(),
+                "timestamp": timestamp,
                 "threat_detection": threat_events,
                 "access_control": access_events,
                 "data_protection": data_protection_events
@@ -60,28 +180,42 @@ class SecurityMonitor:
         except Exception as e:
             logger.error(f"[Security Monitor] Ошибка мониторинга безопасности: {e}")
     
-    async def detect_threats(self) -> Dict[str, Any]:
-        """Детекция угроз безопасности"""
+    async def detect_threats(self, force: bool = False, timestamp: Optional[str] = None) -> Dict[str, Any]:
+        """Детекция угроз безопасности (с кэшированием на THREAT_CACHE_TTL секунд)"""
+        now = time.monotonic()
+        cached = self._threat_cache
+        if not force and cached and now - cached[0] < self.THREAT_CACHE_TTL:
+            return cached[1]
+        
         try:
-            # Анализируем неудачные попытки входа
-            failed_logins = await self.analyze_failed_logins()
-            
-            # Анализируем подозрительную активность IP
-            suspicious_activity = await self.analyze_suspicious_ips()
-            
-            # Анализируем попытки брутфорса
-            brute_force_attempts = await self.detect_brute_force()
-            
-            # Анализируем необычные паттерны трафика
-            unusual_patterns = await self.detect_unusual_patterns()
-            
-            return {
+            # Неудачные входы, подозрительные IP, брутфорс и необычный трафик
+            (failed_logins, suspicious_activity,
+             brute_force_attempts, unusual_patterns) = harden(
+                await asyncio.gather(
+                    self.analyze_failed_logins(),
+                    self.analyze_suspicious_ips(),
+                    self.detect_brute_force(),
+                    self.detect_unusual_patterns(),
+                    return_exceptions=True
+                ),
+                self._THREAT_DEFAULTS,
+                "детекция угроз", _MONITOR
+            )
+            
+            # Уровень угрозы — по уже готовым результатам, без повторного обхода состояния
+            threat_level = await self.calculate_threat_level(
+                failed_logins, suspicious_activity, brute_force_attempts
+            )
+            
+            threats = {
                 "failed_login_attempts": failed_logins,
                 "suspicious_ip_activity": suspicious_activity,
                 "brute_force_attempts": brute_force_attempts,
                 "unusual_traffic_patterns": unusual_patterns,
-                "threat_level": await self.calculate_threat_level()
+                "threat_level": threat_level
             }
+            self._threat_cache = (now, threats, timestamp or datetime.utcnow().isoformat())
+            return threats
             
         except Exception as e:
             logger.error(f"[Security Monitor] Ошибка детекции угроз: {e}")
@@ -90,17 +224,19 @@ class SecurityMonitor:
     async def monitor_access_control(self) -> Dict[str, Any]:
         """Мониторинг контроля доступа"""
         try:
-            # Административные действия
-            admin_actions = await self.get_admin_actions_count()
-            
-            # Попытки эскалации привилегий
-            privilege_escalation = await self.get_privilege_escalation_attempts()
-            
-            # Несанкционированные попытки доступа
-            unauthorized_access = await self.get_unauthorized_access_attempts()
-            
-            # Анализ сессий
-            session_analysis = await self.analyze_sessions()
+            # Административные действия, эскалация привилегий, несанкционированный доступ и сессии
+            (admin_actions, privilege_escalation,
+             unauthorized_access, session_analysis) = harden(
+                await asyncio.gather(
+                    self.get_admin_actions_count(),
+                    self.get_privilege_escalation_attempts(),
+                    self.get_unauthorized_access_attempts(),
+                    self.analyze_sessions(),
+                    return_exceptions=True
+                ),
+                self._ACCESS_DEFAULTS,
+                "контроль доступа", _MONITOR
+            )
             
             return {
                 "admin_actions_count": admin_actions,
@@ -116,17 +252,19 @@ class SecurityMonitor:
     async def monitor_data_protection(self) -> Dict[str, Any]:
         """Мониторинг защиты данных"""
         try:
-            # Попытки нарушения приватности
-            privacy_violations = await self.get_privacy_violation_attempts()
-            
-            # Индикаторы утечки данных
-            data_breach_indicators = await self.get_data_breach_indicators()
-            
-            # Нарушения соответствия требованиям
-            compliance_violations = await self.get_compliance_violations()
-            
-            # Аудит доступа к данным
-            data_access_audit = await self.audit_data_access()
+            # Нарушения приватности, индикаторы утечки, нарушения соответствия и аудит доступа
+            (privacy_violations, data_breach_indicators,
+             compliance_violations, data_access_audit) = harden(
+                await asyncio.gather(
+                    self.get_privacy_violation_attempts(),
+                    self.get_data_breach_indicators(),
+                    self.get_compliance_violations(),
+                    self.audit_data_access(),
+                    return_exceptions=True
+                ),
+                self._DATA_PROTECTION_DEFAULTS,
+                "защита данных", _MONITOR
+            )
             
             return {
                 "privacy_violation_attempts": privacy_violations,
@@ -139,36 +277,47 @@ class SecurityMonitor:
             logger.error(f"[Security Monitor] Ошибка мониторинга защиты данных: {e}")
             return {}
     
+    @staticmethod
+    def _decay(score: float, elapsed: float, decay: Tuple[float, float]) -> float:
+        """Полиномиальное затухание: score * max(0, 1 - (t/τ)**(1/δ))"""
+        lifetime, shape = decay
+        if elapsed >= lifetime:
+            return 0.0
+        return score * (1.0 - (elapsed / lifetime) ** (1.0 / shape))
+    
+    def _decayed_scores(self, table: Dict[Any, Tuple[float, float]],
+                        decay: Tuple[float, float] = FAILED_LOGIN_DECAY) -> Dict[Any, float]:
+        """Текущие счета из таблицы с учетом затухания; угасшие ключи удаляются"""
+        now = time.monotonic()
+        scores = {}
+        for key, (score, last_ts) in list(table.items()):
+            score = self._decay(score, now - last_ts, decay)
+            if score < self.FAILED_SCORE_FLOOR:
+                del table[key]
+            else:
+                scores[key] = score
+        return scores
+    
+    def _decayed_failed_scores(self) -> Dict[IpKey, float]:
+        """Текущие счета неудачных входов с учетом затухания"""
+        return self._decayed_scores(self.failed_scores)
+    
     async def analyze_failed_logins(self) -> Dict[str, Any]:
         """Анализ неудачных попыток входа"""
         try:
-            # Очищаем старые записи (старше 1 часа)
-            cutoff_time = time.time() - 3600
-            for ip in list(self.failed_logins.keys()):
-                self.failed_logins[ip] = [
-                    timestamp for timestamp in self.failed_logins[ip] 
-                    if timestamp > cutoff_time
-                ]
-                if not self.failed_logins[ip]:
-                    del self.failed_logins[ip]
-            
-            # Подсчитываем статистику
-            total_failed = sum(len(attempts) for attempts in self.failed_logins.values())
-            unique_ips = len(self.failed_logins)
+            # Счет затухает до нуля за час и приближает число попыток за последний час
+            scores = self._decayed_failed_scores()
+            total_failed = round(sum(scores.values()))
             
             # Находим наиболее активные IP
-            top_ips = sorted(
-                self.failed_logins.items(),
-                key=lambda x: len(x[1]),
-                reverse=True
-            )[:10]
+            top_ips = heapq.nlargest(10, scores.items(), key=lambda x: x[1])
             
             return {
                 "total_failed_attempts": total_failed,
-                "unique_ips": unique_ips,
+                "unique_ips": len(scores),
                 "top_offending_ips": [
-                    {"ip": ip, "attempts": len(attempts)} 
-                    for ip, attempts in top_ips
+                    {"ip": _ip_str(ip), "attempts": round(score)}
+                    for ip, score in top_ips
                 ],
                 "rate_per_hour": total_failed
             }
@@ -180,24 +329,20 @@ class SecurityMonitor:
     async def analyze_suspicious_ips(self) -> Dict[str, Any]:
         """Анализ подозрительной активности IP"""
         try:
-            # Очищаем старые записи
-            cutoff_time = time.time() - 3600
-            self.suspicious_ips = {
-                ip: count for ip, count in self.suspicious_ips.items()
-                if count > 0
-            }
+            # Счета затухают со временем; угасшие IP удаляются при чтении
+            scores = self._decayed_scores(self.suspicious_ips)
             
             # Находим подозрительные IP
             suspicious_ips = [
-                {"ip": ip, "suspicious_events": count}
-                for ip, count in self.suspicious_ips.items()
-                if count >= 5  # Порог подозрительности
+                {"ip": _ip_str(ip), "suspicious_events": round(score)}
+                for ip, score in scores.items()
+                if score >= 5  # Порог подозрительности
             ]
             
             return {
                 "suspicious_ips_count": len(suspicious_ips),
                 "suspicious_ips": suspicious_ips,
-                "total_suspicious_events": sum(self.suspicious_ips.values())
+                "total_suspicious_events": round(sum(scores.values()))
             }
             
         except Exception as e:
@@ -207,23 +352,37 @@ class SecurityMonitor:
     async def detect_brute_force(self) -> Dict[str, Any]:
         """Детекция попыток брутфорса"""
         try:
-            brute_force_attempts = 0
             brute_force_ips = []
-            
-            # Анализируем IP с множественными неудачными попытками
-            for ip, attempts in self.failed_logins.items():
-                if len(attempts) >= 10:  # Порог для брутфорса
-                    brute_force_attempts += len(attempts)
-                    brute_force_ips.append({
-                        "ip": ip,
-                        "attempts": len(attempts),
-                        "timeframe": "1 hour"
-                    })
+            brute_force_users = []
+            # Суммы попыток по каждому пространству ключей отдельно: одна неудачная
+            # попытка входа учитывается и по IP, и по пользователю
+            attempts = {"ip": 0.0, "user": 0.0}
+            
+            # Один проход по обоим пространствам ключей: IP и пользователи
+            # с множественными неудачными попытками; ключи IP переводятся в строки для отчета
+            keyspaces = (
+                ("ip", _ip_str, self._decayed_failed_scores(), self.BRUTE_FORCE_IP_THRESHOLD,
+                 "1 hour", brute_force_ips),
+                ("user", None, self._decayed_scores(self.failed_by_user, self.USER_FAILED_LOGIN_DECAY),
+                 self.BRUTE_FORCE_USER_THRESHOLD, "5 minutes", brute_force_users),
+            )
+            for field, to_str, scores, threshold, timeframe, found in keyspaces:
+                for key, score in scores.items():
+                    if score >= threshold:
+                        attempts[field] += score
+                        found.append({
+                            field: to_str(key) if to_str else key,
+                            "attempts": round(score),
+                            "timeframe": timeframe
+                        })
             
             return {
-                "brute_force_attempts": brute_force_attempts,
+                # Общее число попыток — только по IP, чтобы не учитывать их дважды
+                "brute_force_attempts": round(attempts["ip"]),
+                "brute_force_user_attempts": round(attempts["user"]),
                 "brute_force_ips": brute_force_ips,
-                "is_brute_force_active": len(brute_force_ips) > 0
+                "brute_force_users": brute_force_users,
+                "is_brute_force_active": bool(brute_force_ips or brute_force_users)
             }
             
         except Exception as e:
@@ -235,26 +394,30 @@ class SecurityMonitor:
         try:
             # Здесь должна быть логика анализа трафика
             # Для примера возвращаем тестовые данные
-            import random
-            
             return {
-                "unusual_traffic_spikes": random.randint(0, 3),
-                "anomalous_connection_patterns": random.randint(0, 2),
-                "suspicious_geographic_activity": random.randint(0, 1),
-                "unusual_time_patterns": random.randint(0, 2)
+                "unusual_traffic_spikes": self._rng.randint(0, 3),
+                "anomalous_connection_patterns": self._rng.randint(0, 2),
+                "suspicious_geographic_activity": self._rng.randint(0, 1),
+                "unusual_time_patterns": self._rng.randint(0, 2)
             }
             
         except Exception as e:
             logger.error(f"[Security Monitor] Ошибка детекции необычных паттернов: {e}")
             return {}
     
-    async def calculate_threat_level(self) -> str:
-        """Расчет уровня угрозы"""
+    async def calculate_threat_level(self, failed_logins: Dict[str, Any],
+                                     suspicious_activity: Dict[str, Any],
+                                     brute_force: Dict[str, Any]) -> str:
+        """Расчет уровня угрозы по результатам анализа входов, IP и брутфорса"""
         try:
             threat_score = 0
+            total_failed = failed_logins.get("total_failed_attempts", 0)
+            suspicious_count = suspicious_activity.get("suspicious_ips_count", 0)
+            # IP и пользователи — два взгляда на одни и те же попытки: берем больший
+            brute_force_count = max(len(brute_force.get("brute_force_ips", ())),
+                                    len(brute_force.get("brute_force_users", ())))
             
             # Анализируем неудачные входы
-            total_failed = sum(len(attempts) for attempts in self.failed_logins.values())
             if total_failed > 50:
                 threat_score += 3
             elif total_failed > 20:
@@ -263,10 +426,6 @@ class SecurityMonitor:
                 threat_score += 1
             
             # Анализируем подозрительные IP
-            suspicious_count = len([
-                ip for ip, count in self.suspicious_ips.items() 
-                if count >= 5
-            ])
             if suspicious_count > 5:
                 threat_score += 3
             elif suspicious_count > 2:
@@ -275,22 +434,20 @@ class SecurityMonitor:
                 threat_score += 1
             
             # Анализируем брутфорс
-            brute_force_count = len([
-                ip for ip, attempts in self.failed_logins.items()
-                if len(attempts) >= 10
-            ])
             if brute_force_count > 0:
                 threat_score += 3
             
             # Определяем уровень угрозы
             if threat_score >= 6:
-                return "critical"
+                threat_level = "critical"
             elif threat_score >= 4:
-                return "high"
+                threat_level = "high"
             elif threat_score >= 2:
-                return "medium"
+                threat_level = "medium"
             else:
-                return "low"
+                threat_level = "low"
+            
+            return threat_level
                 
         except Exception as e:
             logger.error(f"[Security Monitor] Ошибка расчета уровня угрозы: {e}")
@@ -300,8 +457,7 @@ class SecurityMonitor:
         """Получение количества административных действий"""
         try:
             # Здесь должна быть логика получения из базы данных
-            import random
-            return random.randint(5, 25)
+            return self._rng.randint(5, 25)
             
         except Exception as e:
             logger.error(f"[Security Monitor] Ошибка получения админских действий: {e}")
@@ -310,14 +466,9 @@ class SecurityMonitor:
     async def get_privilege_escalation_attempts(self) -> int:
         """Получение количества попыток эскалации привилегий"""
         try:
-            # Очищаем старые записи
-            cutoff_time = time.time() - 86400  # 24 часа
-            self.privilege_attempts = deque([
-                attempt for attempt in self.privilege_attempts
-                if attempt > cutoff_time
-            ], maxlen=1000)
-            
-            return len(self.privilege_attempts)
+            # Счет затухает за 24 часа, очистка старых записей не нужна
+            score, last_ts = self.privilege_attempts
+            return round(self._decay(score, time.monotonic() - last_ts, self.PRIVILEGE_DECAY))
             
         except Exception as e:
             logger.error(f"[Security Monitor] Ошибка получения попыток эскалации: {e}")
@@ -326,14 +477,9 @@ class SecurityMonitor:
     async def get_unauthorized_access_attempts(self) -> int:
         """Получение количества попыток несанкционированного доступа"""
         try:
-            # Очищаем старые записи
-            cutoff_time = time.time() - 86400  # 24 часа
-            self.unauthorized_access = deque([
-                attempt for attempt in self.unauthorized_access
-                if attempt > cutoff_time
-            ], maxlen=1000)
-            
-            return len(self.unauthorized_access)
+            # Счет затухает за 24 часа, очистка старых записей не нужна
+            score, last_ts = self.unauthorized_access
+            return round(self._decay(score, time.monotonic() - last_ts, self.PRIVILEGE_DECAY))
             
         except Exception as e:
             logger.error(f"[Security Monitor] Ошибка получения несанкционированного доступа: {e}")
@@ -343,13 +489,11 @@ class SecurityMonitor:
         """Анализ сессий пользователей"""
         try:
             # Здесь должна быть логика анализа сессий
-            import random
-            
             return {
-                "active_sessions": random.randint(50, 200),
-                "suspicious_sessions": random.randint(0, 3),
-                "long_running_sessions": random.randint(5, 15),
-                "sessions_from_multiple_ips": random.randint(0, 2)
+                "active_sessions": self._rng.randint(50, 200),
+                "suspicious_sessions": self._rng.randint(0, 3),
+                "long_running_sessions": self._rng.randint(5, 15),
+                "sessions_from_multiple_ips": self._rng.randint(0, 2)
             }
             
         except Exception as e:
@@ -360,8 +504,7 @@ class SecurityMonitor:
         """Получение количества попыток нарушения приватности"""
         try:
             # Здесь должна быть логика проверки нарушений приватности
-            import random
-            return random.randint(0, 5)
+            return self._rng.randint(0, 5)
             
         except Exception as e:
             logger.error(f"[Security Monitor] Ошибка получения нарушений приватности: {e}")
@@ -371,8 +514,7 @@ class SecurityMonitor:
         """Получение количества индикаторов утечки данных"""
         try:
             # Здесь должна быть логика проверки утечек
-            import random
-            return random.randint(0, 2)
+            return self._rng.randint(0, 2)
             
         except Exception as e:
             logger.error(f"[Security Monitor] Ошибка получения индикаторов утечки: {e}")
@@ -382,8 +524,7 @@ class SecurityMonitor:
         """Получение количества нарушений соответствия требованиям"""
         try:
             # Здесь должна быть логика проверки соответствия
-            import random
-            return random.randint(0, 3)
+            return self._rng.randint(0, 3)
             
         except Exception as e:
             logger.error(f"[Security Monitor] Ошибка получения нарушений соответствия: {e}")
@@ -393,13 +534,11 @@ class SecurityMonitor:
         """Аудит доступа к данным"""
         try:
             # Здесь должна быть логика аудита доступа
-            import random
-            
             return {
-                "data_access_events": random.randint(100, 500),
-                "sensitive_data_access": random.randint(10, 50),
-                "unauthorized_data_access": random.randint(0, 5),
-                "data_export_events": random.randint(5, 20)
+                "data_access_events": self._rng.randint(100, 500),
+                "sensitive_data_access": self._rng.randint(10, 50),
+                "unauthorized_data_access": self._rng.randint(0, 5),
+                "data_export_events": self._rng.randint(5, 20)
             }
             
         except Exception as e:
@@ -409,30 +548,218 @@ class SecurityMonitor:
     async def store_security_events(self, events: Dict[str, Any]):
         """Сохранение событий безопасности"""
         try:
-            # Добавляем в очередь событий
-            self.security_events.append(events)
+            # Та же картина, что и в прошлый раз: только считаем повтор
+            signature = self._event_signature(events)
+            if signature == self._last_event_signature:
+                self._repeat_count += 1
+                self._repeat_last_seen = events.get("timestamp")
+                return
+            
+            self._enqueue_repeats()
+            self._last_event_signature = signature
+            self._last_event_timestamp = events.get("timestamp")
             
-            # Здесь должна быть логика сохранения в базу данных
-            logger.debug("[Security Monitor] Сохранение событий безопасности")
+            # Добавляем в очередь записи; идентификатор появится после вставки в базу
+            self._enqueue_event(events)
             
         except Exception as e:
             logger.error(f"[Security Monitor] Ошибка сохранения событий: {e}")
     
+    def _event_signature(self, events: Dict[str, Any]) -> int:
+        """Хэш значимых показателей события для поиска повторов"""
+        threats = events.get("threat_detection", {})
+        access = events.get("access_control", {})
+        protection = events.get("data_protection", {})
+        return hash((
+            threats.get("threat_level"),
+            threats.get("failed_login_attempts", {}).get("total_failed_attempts"),
+            threats.get("suspicious_ip_activity", {}).get("suspicious_ips_count"),
+            threats.get("brute_force_attempts", {}).get("is_brute_force_active"),
+            access.get("privilege_escalation_attempts"),
+            access.get("unauthorized_access_attempts"),
+            protection.get("privacy_violation_attempts"),
+            protection.get("data_breach_indicators"),
+            protection.get("compliance_violations")
+        ))
+    
+    def _enqueue_repeats(self):
+        """Сводная запись о повторах предыдущего события, если они были"""
+        if not self._repeat_count:
+            return
+        self._enqueue_event({
+            "timestamp": self._repeat_last_seen,
+            "repeat_of": self._last_event_timestamp,
+            "repeat_count": self._repeat_count
+        })
+        self._repeat_count = 0
+        self._repeat_last_seen = None
+    
+    def _enqueue_event(self, event: Dict[str, Any]):
+        """Постановка записи в очередь на сохранение в базу"""
+        # Запись в базу запускаем при первом событии, когда цикл событий уже работает
+        if self._writer_task is None or self._writer_task.done():
+            self._writer_task = asyncio.create_task(self._write_events())
+        
+        try:
+            self._write_q.put_nowait(event)
+        except asyncio.QueueFull:
+            logger.warning("[Security Monitor] Очередь записи событий переполнена, события отброшены")
+    
+    async def _write_events(self):
+        """Фоновая запись событий: пакет закрывается по размеру или по истечении ожидания"""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._write_q.get()]
+            deadline = loop.time() + self.EVENT_BATCH_WAIT
+            try:
+                # Забираем без ожидания, а на пустой очереди коротко спим:
+                # без таймера wait_for на каждое событие
+                while len(batch) < settings.METRICS_BATCH_SIZE:
+                    try:
+                        batch.append(self._write_q.get_nowait())
+                    except asyncio.QueueEmpty:
+                        remaining = deadline - loop.time()
+                        if remaining <= 0:
+                            break
+                        await asyncio.sleep(min(self.EVENT_POLL_INTERVAL, remaining))
+            except asyncio.CancelledError:
+                # Остановка во время добора: уже собранный пакет не теряем
+                await self._write_events_batch(batch)
+                raise
+            await self._write_events_batch(batch)
+    
+    async def flush_security_events(self):
+        """Немедленная запись всех событий, оставшихся в очереди"""
+        while not self._write_q.empty():
+            batch = []
+            while len(batch) < settings.METRICS_BATCH_SIZE and not self._write_q.empty():
+                batch.append(self._write_q.get_nowait())
+            await self._write_events_batch(batch)
+    
+    async def _write_events_batch(self, batch: List[Dict[str, Any]]):
+        """Пакетная запись событий безопасности"""
+        try:
+            # Запись в SQLite блокирующая: выполняем в отдельном потоке. Поток
+            # не отменить, поэтому при отмене (остановке) дожидаемся его и все
+            # равно учитываем id уже сохраненных строк
+            insert = asyncio.ensure_future(asyncio.to_thread(self._insert_events, batch))
+            try:
+                row_ids = await asyncio.shield(insert)
+            except asyncio.CancelledError:
+                self.security_events.extend(await insert)
+                raise
+            self.security_events.extend(row_ids)
+            logger.debug(f"[Security Monitor] Сохранение событий безопасности: {len(batch)} записей")
+            
+        except Exception as e:
+            logger.error(f"[Security Monitor] Ошибка пакетного сохранения событий: {e}")
+    
+    def _connect_db(self) -> sqlite3.Connection:
+        """Подключение к базе событий: WAL, чтобы чтение не ждало записи (вызывать под _db_lock)"""
+        if self._db is None:
+            path = settings.SECURITY_EVENTS_DB
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            db = sqlite3.connect(path, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS security_events ("
+                "id INTEGER PRIMARY KEY, timestamp TEXT, payload TEXT NOT NULL)"
+            )
+            self._db = db
+        return self._db
+    
+    def _close_db(self):
+        """Закрытие соединения с базой событий"""
+        with self._db_lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+    
+    def _insert_events(self, batch: List[Dict[str, Any]]) -> List[int]:
+        """Вставка пакета событий одной транзакцией; возвращает идентификаторы строк.
+        
+        Строки старше окна security_events удаляются в той же транзакции:
+        база хранит не больше событий, чем на них ссылается память
+        """
+        with self._db_lock:
+            db = self._connect_db()
+            with db:
+                row_ids = [
+                    db.execute(
+                        "INSERT INTO security_events (timestamp, payload) VALUES (?, ?)",
+                        (event.get("timestamp"), json.dumps(event, default=str))
+                    ).lastrowid
+                    for event in batch
+                ]
+                if row_ids:
+                    db.execute(
+                        "DELETE FROM security_events WHERE id <= ?",
+                        (row_ids[-1] - self.security_events.maxlen,)
+                    )
+                return row_ids
+    
+    def _select_events(self, row_ids: List[int]) -> List[Dict[str, Any]]:
+        """Чтение событий по идентификаторам в порядке сохранения"""
+        placeholders = ",".join("?" * len(row_ids))
+        with self._db_lock:
+            rows = self._connect_db().execute(
+                f"SELECT payload FROM security_events WHERE id IN ({placeholders}) ORDER BY id",
+                row_ids
+            ).fetchall()
+        return [json.loads(payload) for (payload,) in rows]
+    
+    async def get_recent_security_events(self, limit: int = 100) -> List[Dict[str, Any]]:
+        """Последние сохраненные события безопасности"""
+        try:
+            row_ids = list(self.security_events)[-limit:] if limit > 0 else []
+            if not row_ids:
+                return []
+            return await asyncio.to_thread(self._select_events, row_ids)
+            
+        except Exception as e:
+            logger.error(f"[Security Monitor] Ошибка чтения событий безопасности: {e}")
+            return []
+    
     async def check_security_alerts(self, events: Dict[str, Any]):
         """Проверка алертов безопасности"""
         try:
+            # Обычно угроза низкая: выходим сразу по уровню из переданных событий
             threat_level = events.get("threat_detection", {}).get("threat_level", "low")
+            if threat_level not in ("critical", "high", "medium"):
+                return
             
-            if threat_level == "critical":
-                await self.trigger_critical_alert(events)
-            elif threat_level == "high":
-                await self.trigger_high_alert(events)
-            elif threat_level == "medium":
-                await self.trigger_medium_alert(events)
-                
+            # Отправитель запускаем при первом алерте, когда цикл событий уже работает
+            if self._alert_task is None or self._alert_task.done():
+                self._alert_task = asyncio.create_task(self._drain_alerts())
+            
+            self._alert_q.put_nowait((threat_level, events))
+            
+        except asyncio.QueueFull:
+            logger.warning("[Security Monitor] Очередь алертов переполнена, алерт отброшен")
         except Exception as e:
             logger.error(f"[Security Monitor] Ошибка проверки алертов: {e}")
     
+    async def _drain_alerts(self):
+        """Фоновая отправка алертов из очереди"""
+        triggers = {
+            "critical": self.trigger_critical_alert,
+            "high": self.trigger_high_alert,
+            "medium": self.trigger_medium_alert
+        }
+        while True:
+            item = await self._alert_q.get()
+            if item is None:
+                return
+            
+            threat_level, events = item
+            try:
+                await triggers[threat_level](events)
+            except Exception as e:
+                logger.error(f"[Security Monitor] Ошибка отправки алерта: {e}")
+    
     async def trigger_critical_alert(self, events: Dict[str, Any]):
         """Срабатывание критического алерта"""
         logger.critical("[Security Monitor] КРИТИЧЕСКИЙ АЛЕРТ БЕЗОПАСНОСТИ")
@@ -448,45 +775,67 @@ class SecurityMonitor:
         logger.info("[Security Monitor] СРЕДНИЙ АЛЕРТ БЕЗОПАСНОСТИ")
         # Здесь должна быть логика отправки средних уведомлений
     
-    def record_failed_login(self, ip: str):
-        """Запись неудачной попытки входа"""
-        try:
-            self.failed_logins[ip].append(time.time())
-        except Exception as e:
-            logger.error(f"[Security Monitor] Ошибка записи неудачного входа: {e}")
+    # Запись событий вызывается на каждом запросе: без try/except, операции
+    # ниже не бросают исключений для корректного IP
+    
+    def record_failed_login(self, ip: str, user: Optional[str] = None):
+        """Запись неудачной попытки входа (по IP и, если известен, по пользователю)"""
+        key = _ip_key(ip)
+        if key is None:
+            logger.warning(f"[Security Monitor] Некорректный IP неудачного входа: {ip!r}")
+            return
+        now = time.monotonic()
+        score, last_ts = self.failed_scores.get(key, (0.0, now))
+        score = self._decay(score, now - last_ts, self.FAILED_LOGIN_DECAY)
+        self.failed_scores[key] = (score + 1.0, now)
+        if user is not None:
+            user = anonymize_user_id(user)
+            score, last_ts = self.failed_by_user.pop(user, (0.0, now))
+            score = self._decay(score, now - last_ts, self.USER_FAILED_LOGIN_DECAY)
+            self.failed_by_user[user] = (score + 1.0, now)
+            if len(self.failed_by_user) > self.FAILED_USER_LIMIT:
+                self.failed_by_user.popitem(last=False)
     
     def record_suspicious_activity(self, ip: str):
         """Запись подозрительной активности"""
-        try:
-            self.suspicious_ips[ip] += 1
-        except Exception as e:
-            logger.error(f"[Security Monitor] Ошибка записи подозрительной активности: {e}")
+        key = _ip_key(ip)
+        if key is None:
+            logger.warning(f"[Security Monitor] Некорректный IP подозрительной активности: {ip!r}")
+            return
+        now = time.monotonic()
+        score, last_ts = self.suspicious_ips.pop(key, (0.0, now))
+        score = self._decay(score, now - last_ts, self.FAILED_LOGIN_DECAY)
+        # Повторная вставка переносит IP в конец: вытесняются давно не обновлявшиеся
+        self.suspicious_ips[key] = (score + 1.0, now)
+        if len(self.suspicious_ips) > self.SUSPICIOUS_IP_LIMIT:
+            self.suspicious_ips.popitem(last=False)
     
     def record_privilege_escalation(self):
         """Запись попытки эскалации привилегий"""
-        try:
-            self.privilege_attempts.append(time.time())
-        except Exception as e:
-            logger.error(f"[Security Monitor] Ошибка записи эскалации привилегий: {e}")
+        now = time.monotonic()
+        score, last_ts = self.privilege_attempts
+        self.privilege_attempts = (self._decay(score, now - last_ts, self.PRIVILEGE_DECAY) + 1.0, now)
     
     def record_unauthorized_access(self):
         """Запись несанкционированного доступа"""
-        try:
-            self.unauthorized_access.append(time.time())
-        except Exception as e:
-            logger.error(f"[Security Monitor] Ошибка записи несанкционированного доступа: {e}")
+        now = time.monotonic()
+        score, last_ts = self.unauthorized_access
+        self.unauthorized_access = (self._decay(score, now - last_ts, self.PRIVILEGE_DECAY) + 1.0, now)
     
     async def get_security_summary(self) -> Dict[str, Any]:
         """Получение сводки по безопасности"""
         try:
             threat_events = await self.detect_threats()
+            # Время последнего расчета угроз, без форматирования на каждый запрос
+            cached = self._threat_cache
+            last_check = cached[2] if cached else datetime.utcnow().isoformat()
             
             return {
                 "threat_level": threat_events.get("threat_level", "unknown"),
                 "failed_logins": threat_events.get("failed_login_attempts", {}).get("total_failed_attempts", 0),
                 "suspicious_ips": threat_events.get("suspicious_ip_activity", {}).get("suspicious_ips_count", 0),
                 "brute_force_active": threat_events.get("brute_force_attempts", {}).get("is_brute_force_active", False),
-                "last_check": datetime.utcnow().isoformat()
+                "last_check": last_check
             }
             
         except Exception as e:
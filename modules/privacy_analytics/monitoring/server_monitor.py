@@ -2,41 +2,205 @@
 Мониторинг серверов с соблюдением приватности
 """
 
+import array
 import asyncio
+import math
 import psutil
+import random
+import threading
 import time
+from collections import Counter
+from dataclasses import dataclass
 from datetime import datetime, timedelta
-from typing import Dict, List, Any, Optional
+from typing import Dict, Hashable, List, Any, Optional, Tuple
 import aiohttp
-import asyncpg
+import numpy as np
+import orjson
+from sqlalchemy import select
+
+from database import async_session_maker
+from database.models import Server
 
 from .. import settings
 from ..privacy import PrivacyComplianceChecker
+from ._util import harden
 from logger import logger
 
+# Имя монитора в сообщениях лога
+_MONITOR = "Server Monitor"
+
+# Первый вызов без интервала запоминает счетчики CPU: дальше cpu_percent(None)
+# сразу возвращает загрузку с предыдущего вызова, не блокируя цикл событий
+psutil.cpu_percent(interval=None)
+
+
+# Гистограмма латентности: 32 корзины по степеням двойки, корзина b — [2**b, 2**(b+1)) мс
+LATENCY_BUCKETS = 32
+
+# Статус сервера по индексу здоровья: позиция — номер десятка, в который попадает индекс
+# ((0, 10] -> 0, ..., (90, 100] -> 9); выше 70 — online, выше 40 — warning
+_STATUS = ("critical",) * 4 + ("warning",) * 3 + ("online",) * 3
+
+
+def _latency_quantile(hist: array.array, total: int, q: float) -> float:
+    """Квантиль латентности по гистограмме: верхняя граница корзины, в которую он попадает"""
+    rank = q * total
+    seen = 0
+    for bucket, count in enumerate(hist):
+        seen += count
+        if seen >= rank:
+            return float(2 ** (bucket + 1))
+    return float(2 ** LATENCY_BUCKETS)
+
+
+@dataclass(slots=True)
+class CachedServerMetrics:
+    """Последние метрики сервера: показатели для сводки и сериализованный пакет"""
+    server_id: str
+    ts_ns: int
+    timestamp: datetime
+    cpu: float
+    mem: float
+    disk: float
+    latency: float
+    err: float
+    conns: int
+    bw_gb: float
+    payload_bytes: bytes
+
+
+def _schema_signature(value: Any) -> Hashable:
+    """Подпись структуры метрик для проверки приватности: ключи, строковые значения
+    и типы остальных значений (числа — собственные замеры монитора)"""
+    if isinstance(value, dict):
+        return tuple((key, _schema_signature(item)) for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return tuple(_schema_signature(item) for item in value)
+    if isinstance(value, str):
+        return value
+    return type(value)
+
+
+def _emptied(target: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Пустой результат: очищенный переданный словарь или новый"""
+    if target is None:
+        return {}
+    target.clear()
+    return target
+
 
 class ServerMonitor:
     """Мониторинг серверов без нарушения приватности пользователей"""
     
+    # Группы метрик сервера в порядке параллельного сбора
+    _METRIC_GROUPS = ("system_metrics", "vpn_metrics", "quality_metrics")
+    # Значения по умолчанию для параллельно собираемых VPN-показателей, по позициям
+    _VPN_DEFAULTS = (0, 0, {}, {}, 0.0)
+    # Индекс здоровья по (cpu, mem, disk, latency, err): множители перевода в штраф и веса
+    _HEALTH_SCALES = np.array([1.0, 1.0, 1.0, 0.1, 10.0])
+    _HEALTH_WEIGHTS = np.array([0.25, 0.25, 0.2, 0.15, 0.15])
+    # Тестовый список серверов (USE_MOCK_METRICS); латентность в этом режиме тоже тестовая
+    _MOCK_SERVERS = (
+        {"id": "server_1", "name": "US Server", "enabled": True},
+        {"id": "server_2", "name": "EU Server", "enabled": True},
+        {"id": "server_3", "name": "Asia Server", "enabled": True}
+    )
+    
     def __init__(self):
         self.privacy_checker = PrivacyComplianceChecker()
-        self.metrics_cache = {}
-        self.last_collection = {}
+        self.metrics_cache: Dict[str, CachedServerMetrics] = {}
+        # Момент последнего сбора по серверу, time.monotonic_ns()
+        self.last_collection: Dict[str, int] = {}
+        # Загрузка CPU обновляется фоновой задачей раз в интервал мониторинга
+        self._cpu_percent = 0.0
+        self._cpu_task: Optional[asyncio.Task] = None
+        # Число CPU и время загрузки не меняются за время работы процесса
+        self._cpu_count = psutil.cpu_count()
+        self._boot_time = psutil.boot_time()
+        # Предыдущий замер сетевых счетчиков (отправлено, получено, monotonic_ns)
+        # и скорости по нему, байт/с; меняются только под _net_lock
+        self._prev_net: Optional[Tuple[int, int, int]] = None
+        self._net_rates: Tuple[float, float] = (0.0, 0.0)
+        self._net_lock = threading.Lock()
+        # Сериализованные метрики текущего цикла: сохраняются одним пакетом в конце цикла
+        self._pending_metrics: List[Tuple[str, bytes]] = []
+        # Словари метрик по серверам создаются один раз и заполняются на месте каждый цикл
+        self._metric_slots: Dict[str, Dict[str, Any]] = {}
+        # Результаты проверки приватности в текущем цикле по подписи структуры метрик
+        # и уже проверенные имена серверов (имя в подпись не входит)
+        self._validated_sigs: Dict[Hashable, bool] = {}
+        self._validated_server_ids: Dict[str, bool] = {}
+        # Гистограммы латентности по серверам: фиксированный размер вместо списка замеров
+        self._latency_hist: Dict[str, array.array] = {}
+        # Общая HTTP-сессия замеров латентности и адреса API серверов для замера
+        self._http: Optional[aiohttp.ClientSession] = None
+        self._server_urls: Dict[str, str] = {}
+        # Счетчики трафика по серверам: у каждого потока свой набор (подключения, байты),
+        # запись идет без блокировок, при чтении наборы суммируются
+        self._traffic_local = threading.local()
+        self._traffic_shards: List[Tuple[Counter, Counter]] = []
+        self._traffic_shards_lock = threading.Lock()
         
+    async def stop(self):
+        """Остановка фонового замера загрузки CPU и закрытие HTTP-сессии"""
+        if self._cpu_task:
+            self._cpu_task.cancel()
+            try:
+                await self._cpu_task
+            except asyncio.CancelledError:
+                pass
+            self._cpu_task = None
+        await self.close()
+    
+    async def close(self):
+        """Закрытие HTTP-сессии замеров латентности"""
+        if self._http and not self._http.closed:
+            await self._http.close()
+        self._http = None
+    
+    def _get_http(self) -> aiohttp.ClientSession:
+        """Общая сессия: соединения к серверам переиспользуются между замерами"""
+        if self._http is None or self._http.closed:
+            self._http = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=settings.SERVER_LATENCY_PROBE_TIMEOUT),
+                connector=aiohttp.TCPConnector(limit=100, ttl_dns_cache=300, keepalive_timeout=60)
+            )
+        return self._http
+    
+    async def _sample_cpu(self):
+        """Периодический замер загрузки CPU с момента предыдущего замера"""
+        while True:
+            await asyncio.sleep(settings.SERVER_MONITORING_INTERVAL)
+            self._cpu_percent = await asyncio.to_thread(psutil.cpu_percent, None)
+    
     async def collect_all_metrics(self):
         """Сбор метрик со всех серверов"""
         try:
+            # Проверки приватности кэшируются в пределах одного цикла
+            self._validated_sigs.clear()
+            
             # Получаем список серверов из базы данных
             servers = await self.get_active_servers()
             
-            tasks = []
-            for server in servers:
-                task = self.collect_server_metrics(server['id'])
-                tasks.append(task)
+            # Собираем метрики параллельно, но не больше MAX_CONCURRENT_MONITORING_TASKS
+            # серверов одновременно: пул подключений и HTTP-сессия не перегружаются
+            semaphore = asyncio.Semaphore(settings.MAX_CONCURRENT_MONITORING_TASKS)
+            
+            async def guarded(server_id: str):
+                async with semaphore:
+                    await self.collect_server_metrics(server_id)
+            
+            if servers:
+                await asyncio.gather(
+                    *(guarded(server['id']) for server in servers),
+                    return_exceptions=True
+                )
+            
+            # Сохраняем метрики всех серверов одной пакетной записью
+            await self.flush_metrics()
             
-            # Собираем метрики параллельно
-            if tasks:
-                await asyncio.gather(*tasks, return_exceptions=True)
+            # Серверы, которые давно не собирались (например, отключенные), убираем из памяти
+            self._purge_expired()
                 
         except Exception as e:
             logger.error(f"[Server Monitor] Ошибка сбора метрик: {e}")
@@ -44,117 +208,182 @@ class ServerMonitor:
     async def collect_server_metrics(self, server_id: str):
         """Сбор метрик конкретного сервера"""
         try:
-            # Проверяем, не слишком ли часто собираем метрики
-            now = datetime.utcnow()
-            if (server_id in self.last_collection and 
-                (now - self.last_collection[server_id]).seconds < settings.SERVER_MONITORING_INTERVAL):
+            # Проверяем, не слишком ли часто собираем метрики: целочисленное сравнение
+            # по монотонным часам, без создания datetime на пропущенных вызовах
+            now_ns = time.monotonic_ns()
+            last_ns = self.last_collection.get(server_id)
+            if last_ns is not None and now_ns - last_ns < settings.SERVER_MONITORING_INTERVAL * 1_000_000_000:
                 return
             
-            self.last_collection[server_id] = now
-            
-            # Собираем системные метрики
-            system_metrics = await self.get_system_metrics()
-            
-            # Собираем VPN-метрики (анонимизированные)
-            vpn_metrics = await self.get_vpn_metrics(server_id)
-            
-            # Собираем метрики качества
-            quality_metrics = await self.get_quality_metrics(server_id)
+            self.last_collection[server_id] = now_ns
+            now = datetime.utcnow()
             
-            # Объединяем все метрики
-            metrics = {
-                "server_id": server_id,
-                "timestamp": now.isoformat(),
-                "system_metrics": system_metrics,
-                "vpn_metrics": vpn_metrics,
-                "quality_metrics": quality_metrics
-            }
+            # Один и тот же словарь метрик сервера на все циклы: вложенные группы
+            # заполняются на месте, без новых словарей на каждый цикл
+            metrics = self._metric_slots.get(server_id)
+            if metrics is None:
+                metrics = self._metric_slots[server_id] = {
+                    "server_id": server_id,
+                    "timestamp": None,
+                    "system_metrics": {},
+                    "vpn_metrics": {},
+                    "quality_metrics": {}
+                }
+            # datetime в ISO-строку переводит orjson при сериализации
+            metrics["timestamp"] = now
+            
+            # Системные, VPN- (анонимизированные) и метрики качества независимы:
+            # собираем параллельно, упавшая группа остается пустой
+            results = await asyncio.gather(
+                self.get_system_metrics(metrics["system_metrics"]),
+                self.get_vpn_metrics(server_id, metrics["vpn_metrics"]),
+                self.get_quality_metrics(server_id, metrics["quality_metrics"]),
+                return_exceptions=True
+            )
+            for group, result in zip(self._METRIC_GROUPS, results):
+                if isinstance(result, Exception):
+                    logger.error(f"[Server Monitor] Ошибка получения ({group}) сервера {server_id}: {result}")
+                    metrics[group].clear()
             
             # Проверяем соответствие требованиям приватности
-            if not await self.privacy_checker.validate_metrics(metrics):
+            if not await self._validate_metrics(server_id, metrics):
                 logger.warning(f"[Server Monitor] Метрики сервера {server_id} не прошли проверку приватности")
                 return
             
-            # Сохраняем метрики
-            await self.store_metrics(metrics)
-            
-            # Кэшируем для быстрого доступа
-            self.metrics_cache[server_id] = {
-                "data": metrics,
-                "timestamp": now
-            }
+            # Сериализуем один раз: те же байты идут и в базу, и экспортерам
+            payload = orjson.dumps(metrics, option=orjson.OPT_NAIVE_UTC | orjson.OPT_UTC_Z)
+            
+            # Откладываем до пакетной записи в конце цикла
+            self.store_metrics(server_id, payload)
+            
+            # Кэшируем для быстрого доступа только показатели сводки
+            system = metrics["system_metrics"]
+            vpn = metrics["vpn_metrics"]
+            quality = metrics["quality_metrics"]
+            self.metrics_cache[server_id] = CachedServerMetrics(
+                server_id=server_id,
+                ts_ns=now_ns,
+                timestamp=now,
+                cpu=system.get("cpu_usage_percent", 0.0),
+                mem=system.get("memory_usage_percent", 0.0),
+                disk=system.get("disk_usage_percent", 0.0),
+                latency=quality.get("avg_latency_ms", 0.0),
+                err=quality.get("error_rate_percent", 0.0),
+                conns=vpn.get("total_connections", 0),
+                bw_gb=vpn.get("total_bandwidth_gb", 0.0),
+                payload_bytes=payload
+            )
             
             logger.debug(f"[Server Monitor] Метрики сервера {server_id} собраны успешно")
             
         except Exception as e:
             logger.error(f"[Server Monitor] Ошибка сбора метрик сервера {server_id}: {e}")
     
-    async def get_system_metrics(self) -> Dict[str, Any]:
-        """Получение системных метрик сервера"""
+    async def get_system_metrics(self, target: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Получение системных метрик сервера (в target, если передан)"""
         try:
-            # CPU
-            cpu_percent = psutil.cpu_percent(interval=1)
-            cpu_count = psutil.cpu_count()
-            
-            # Память
-            memory = psutil.virtual_memory()
-            memory_percent = memory.percent
-            memory_available_gb = memory.available / (1024**3)
+            # CPU: последний замер фоновой задачи; замер запускаем при первом обращении,
+            # когда цикл событий уже работает
+            if self._cpu_task is None or self._cpu_task.done():
+                self._cpu_percent = psutil.cpu_percent(interval=None)
+                self._cpu_task = asyncio.create_task(self._sample_cpu())
             
-            # Диск
-            disk = psutil.disk_usage('/')
-            disk_percent = disk.percent
-            disk_free_gb = disk.free / (1024**3)
+            # Вызовы psutil читают /proc и блокируют: выполняем их в отдельном потоке
+            return await asyncio.to_thread(self._probe_system_sync, target)
             
-            # Сеть
+        except Exception as e:
+            logger.error(f"[Server Monitor] Ошибка получения системных метрик: {e}")
+            return _emptied(target)
+    
+    def _probe_system_sync(self, target: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Синхронный опрос системных метрик через psutil"""
+        cpu_percent = self._cpu_percent
+        cpu_count = self._cpu_count
+        
+        # Память
+        memory = psutil.virtual_memory()
+        memory_percent = memory.percent
+        memory_available_gb = memory.available / (1024**3)
+        
+        # Диск
+        disk = psutil.disk_usage('/')
+        disk_percent = disk.percent
+        disk_free_gb = disk.free / (1024**3)
+        
+        # Сеть: опрос идет из нескольких потоков сразу, поэтому снимок счетчиков
+        # и пересчет скорости — под блокировкой, иначе два потока посчитали бы
+        # скорость от одного и того же предыдущего снимка
+        with self._net_lock:
             network = psutil.net_io_counters()
             network_bytes_sent = network.bytes_sent
             network_bytes_recv = network.bytes_recv
-            
-            # Время работы
-            boot_time = psutil.boot_time()
-            uptime_seconds = time.time() - boot_time
-            uptime_hours = uptime_seconds / 3600
-            
-            return {
-                "cpu_usage_percent": round(cpu_percent, 2),
-                "cpu_count": cpu_count,
-                "memory_usage_percent": round(memory_percent, 2),
-                "memory_available_gb": round(memory_available_gb, 2),
-                "disk_usage_percent": round(disk_percent, 2),
-                "disk_free_gb": round(disk_free_gb, 2),
-                "network_bytes_sent": network_bytes_sent,
-                "network_bytes_recv": network_bytes_recv,
-                "uptime_hours": round(uptime_hours, 2)
-            }
-            
-        except Exception as e:
-            logger.error(f"[Server Monitor] Ошибка получения системных метрик: {e}")
-            return {}
+            now_ns = time.monotonic_ns()
+            prev = self._prev_net
+            if prev is None:
+                self._prev_net = (network_bytes_sent, network_bytes_recv, now_ns)
+            elif now_ns - prev[2] >= 1_000_000_000:
+                # Скорость считаем по окну не короче секунды: серверы одного цикла
+                # опрашивают хост почти одновременно и получают последнюю скорость
+                elapsed = (now_ns - prev[2]) / 1e9
+                self._net_rates = (
+                    (network_bytes_sent - prev[0]) / elapsed,
+                    (network_bytes_recv - prev[1]) / elapsed
+                )
+                self._prev_net = (network_bytes_sent, network_bytes_recv, now_ns)
+            sent_per_sec, recv_per_sec = self._net_rates
+        
+        # Время работы
+        uptime_seconds = time.time() - self._boot_time
+        uptime_hours = uptime_seconds / 3600
+        
+        metrics = {} if target is None else target
+        metrics["cpu_usage_percent"] = round(cpu_percent, 2)
+        metrics["cpu_count"] = cpu_count
+        metrics["memory_usage_percent"] = round(memory_percent, 2)
+        metrics["memory_available_gb"] = round(memory_available_gb, 2)
+        metrics["disk_usage_percent"] = round(disk_percent, 2)
+        metrics["disk_free_gb"] = round(disk_free_gb, 2)
+        metrics["network_bytes_sent"] = network_bytes_sent
+        metrics["network_bytes_recv"] = network_bytes_recv
+        metrics["bytes_sent_per_sec"] = round(sent_per_sec, 2)
+        metrics["bytes_recv_per_sec"] = round(recv_per_sec, 2)
+        metrics["uptime_hours"] = round(uptime_hours, 2)
+        return metrics
     
-    async def get_vpn_metrics(self, server_id: str) -> Dict[str, Any]:
-        """Получение VPN-метрик (анонимизированных)"""
+    async def get_vpn_metrics(self, server_id: str,
+                              target: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Получение VPN-метрик (анонимизированных, в target, если передан)"""
         try:
-            # Получаем общую статистику без привязки к пользователям
-            total_connections = await self.get_total_connections(server_id)
-            total_bandwidth = await self.get_total_bandwidth(server_id)
-            protocol_stats = await self.get_protocol_stats(server_id)
-            geo_stats = await self.get_geo_stats(server_id)
+            # Получаем общую статистику без привязки к пользователям;
+            # запросы независимы и выполняются параллельно
+            (total_connections, total_bandwidth, protocol_stats,
+             geo_stats, avg_duration) = harden(
+                await asyncio.gather(
+                    self.get_total_connections(server_id),
+                    self.get_total_bandwidth(server_id),
+                    self.get_protocol_stats(server_id),
+                    self.get_geo_stats(server_id),
+                    self.get_avg_connection_duration(server_id),
+                    return_exceptions=True
+                ),
+                self._VPN_DEFAULTS, "VPN-метрики", _MONITOR
+            )
             
-            return {
-                "total_connections": total_connections,
-                "total_bandwidth_gb": round(total_bandwidth / (1024**3), 2),
-                "protocol_distribution": protocol_stats,
-                "geographic_distribution": geo_stats,
-                "avg_connection_duration_minutes": await self.get_avg_connection_duration(server_id)
-            }
+            metrics = {} if target is None else target
+            metrics["total_connections"] = total_connections
+            metrics["total_bandwidth_gb"] = round(total_bandwidth / (1024**3), 2)
+            metrics["protocol_distribution"] = protocol_stats
+            metrics["geographic_distribution"] = geo_stats
+            metrics["avg_connection_duration_minutes"] = avg_duration
+            return metrics
             
         except Exception as e:
             logger.error(f"[Server Monitor] Ошибка получения VPN-метрик: {e}")
-            return {}
+            return _emptied(target)
     
-    async def get_quality_metrics(self, server_id: str) -> Dict[str, Any]:
-        """Получение метрик качества соединения"""
+    async def get_quality_metrics(self, server_id: str,
+                                  target: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Получение метрик качества соединения (в target, если передан)"""
         try:
             # Тестируем латентность
             latency = await self.test_latency(server_id)
@@ -164,38 +393,76 @@ class ServerMonitor:
             
             # Получаем статистику успешных подключений
             success_rate = await self.get_success_rate(server_id)
-            
-            return {
-                "avg_latency_ms": latency,
-                "error_rate_percent": error_rate,
-                "success_rate_percent": success_rate,
-                "packet_loss_percent": await self.get_packet_loss(server_id)
-            }
+            packet_loss = await self.get_packet_loss(server_id)
+            
+            metrics = {} if target is None else target
+            metrics["avg_latency_ms"] = latency
+            # Распределение латентности за все замеры сервера
+            hist = self._latency_hist.get(server_id)
+            total = sum(hist) if hist else 0
+            for key, q in (("latency_p50_ms", 0.5), ("latency_p95_ms", 0.95), ("latency_p99_ms", 0.99)):
+                metrics[key] = _latency_quantile(hist, total, q) if total else 0.0
+            metrics["error_rate_percent"] = error_rate
+            metrics["success_rate_percent"] = success_rate
+            metrics["packet_loss_percent"] = packet_loss
+            return metrics
             
         except Exception as e:
             logger.error(f"[Server Monitor] Ошибка получения метрик качества: {e}")
-            return {}
+            return _emptied(target)
     
     async def get_active_servers(self) -> List[Dict[str, Any]]:
         """Получение списка активных серверов"""
         try:
-            # Здесь должна быть логика получения серверов из базы данных
-            # Для примера возвращаем тестовые данные
+            # В тестовом режиме база не нужна: фиксированный список серверов
+            if settings.USE_MOCK_METRICS:
+                return [dict(server) for server in self._MOCK_SERVERS]
+            
+            # Соединение берется из общего пула приложения и возвращается в него при выходе
+            async with async_session_maker() as session:
+                result = await session.execute(
+                    select(Server.server_name, Server.cluster_name, Server.api_url)
+                    .where(Server.enabled.is_(True))
+                )
+                rows = result.all()
+            
+            # Адреса API нужны для замера латентности
+            self._server_urls = {server_name: api_url for server_name, _, api_url in rows if api_url}
+            # Имя сервера уникально и служит его идентификатором
             return [
-                {"id": "server_1", "name": "US Server", "enabled": True},
-                {"id": "server_2", "name": "EU Server", "enabled": True},
-                {"id": "server_3", "name": "Asia Server", "enabled": True}
+                {"id": server_name, "name": server_name, "cluster": cluster_name, "enabled": True}
+                for server_name, cluster_name, _ in rows
             ]
         except Exception as e:
             logger.error(f"[Server Monitor] Ошибка получения списка серверов: {e}")
             return []
     
+    def record_traffic(self, server_id: str, connections: int = 0, bytes_count: int = 0):
+        """Учет подключений и трафика сервера в счетчиках текущего потока"""
+        shard = getattr(self._traffic_local, "shard", None)
+        if shard is None:
+            shard = self._traffic_local.shard = (Counter(), Counter())
+            # Блокировка только при появлении нового потока
+            with self._traffic_shards_lock:
+                self._traffic_shards.append(shard)
+        shard[0][server_id] += connections
+        shard[1][server_id] += bytes_count
+    
+    def _traffic_totals(self, server_id: str) -> Tuple[int, int]:
+        """Сумма подключений и байтов сервера по счетчикам всех потоков"""
+        connections = 0
+        bytes_count = 0
+        for shard_connections, shard_bytes in tuple(self._traffic_shards):
+            connections += shard_connections[server_id]
+            bytes_count += shard_bytes[server_id]
+        return connections, bytes_count
+    
     async def get_total_connections(self, server_id: str) -> int:
         """Получение общего количества подключений (анонимизированно)"""
         try:
-            # Здесь должна быть логика получения из панели управления
+            if not settings.USE_MOCK_METRICS:
+                return self._traffic_totals(server_id)[0]
             # Возвращаем случайное число для примера
-            import random
             return random.randint(50, 200)
         except Exception as e:
             logger.error(f"[Server Monitor] Ошибка получения количества подключений: {e}")
@@ -204,8 +471,8 @@ class ServerMonitor:
     async def get_total_bandwidth(self, server_id: str) -> int:
         """Получение общего трафика в байтах (анонимизированно)"""
         try:
-            # Здесь должна быть логика получения из панели управления
-            import random
+            if not settings.USE_MOCK_METRICS:
+                return self._traffic_totals(server_id)[1]
             return random.randint(1000000000, 5000000000)  # 1-5 GB
         except Exception as e:
             logger.error(f"[Server Monitor] Ошибка получения трафика: {e}")
@@ -244,7 +511,6 @@ class ServerMonitor:
     async def get_avg_connection_duration(self, server_id: str) -> float:
         """Получение средней продолжительности соединения в минутах"""
         try:
-            import random
             return round(random.uniform(30, 180), 2)  # 30-180 минут
         except Exception as e:
             logger.error(f"[Server Monitor] Ошибка получения продолжительности соединения: {e}")
@@ -253,9 +519,24 @@ class ServerMonitor:
     async def test_latency(self, server_id: str) -> float:
         """Тестирование латентности сервера"""
         try:
-            # Здесь должна быть логика тестирования латентности
-            import random
-            return round(random.uniform(50, 300), 2)  # 50-300 мс
+            if settings.USE_MOCK_METRICS:
+                latency = round(random.uniform(50, 300), 2)  # 50-300 мс
+            else:
+                url = self._server_urls.get(server_id)
+                if not url:
+                    return 0.0
+                # Время полного ответа API сервера через общую сессию
+                started = time.monotonic()
+                async with self._get_http().get(url) as response:
+                    await response.read()
+                latency = round((time.monotonic() - started) * 1000, 2)
+            
+            # Учитываем замер в гистограмме сервера
+            hist = self._latency_hist.get(server_id)
+            if hist is None:
+                hist = self._latency_hist[server_id] = array.array('Q', bytes(8 * LATENCY_BUCKETS))
+            hist[min(LATENCY_BUCKETS - 1, int(math.log2(max(1.0, latency))))] += 1
+            return latency
         except Exception as e:
             logger.error(f"[Server Monitor] Ошибка тестирования латентности: {e}")
             return 0.0
@@ -263,7 +544,6 @@ class ServerMonitor:
     async def get_error_rate(self, server_id: str) -> float:
         """Получение процента ошибок"""
         try:
-            import random
             return round(random.uniform(0, 5), 2)  # 0-5%
         except Exception as e:
             logger.error(f"[Server Monitor] Ошибка получения процента ошибок: {e}")
@@ -272,7 +552,6 @@ class ServerMonitor:
     async def get_success_rate(self, server_id: str) -> float:
         """Получение процента успешных подключений"""
         try:
-            import random
             return round(random.uniform(95, 100), 2)  # 95-100%
         except Exception as e:
             logger.error(f"[Server Monitor] Ошибка получения процента успешных подключений: {e}")
@@ -281,41 +560,97 @@ class ServerMonitor:
     async def get_packet_loss(self, server_id: str) -> float:
         """Получение процента потери пакетов"""
         try:
-            import random
             return round(random.uniform(0, 2), 2)  # 0-2%
         except Exception as e:
             logger.error(f"[Server Monitor] Ошибка получения потери пакетов: {e}")
             return 0.0
     
-    async def store_metrics(self, metrics: Dict[str, Any]):
-        """Сохранение метрик в базу данных"""
+    async def _validate_metrics(self, server_id: str, metrics: Dict[str, Any]) -> bool:
+        """Проверка приватности: метрики одной структуры проверяются раз за цикл"""
+        # Имя сервера задает администратор, оно не меняется: проверяем один раз
+        server_valid = self._validated_server_ids.get(server_id)
+        if server_valid is None:
+            server_valid = await self.privacy_checker.validate_metrics({"server_id": server_id})
+            self._validated_server_ids[server_id] = server_valid
+        if not server_valid:
+            return False
+        
+        signature = _schema_signature({key: value for key, value in metrics.items() if key != "server_id"})
+        valid = self._validated_sigs.get(signature)
+        if valid is None:
+            valid = await self.privacy_checker.validate_metrics(metrics)
+            self._validated_sigs[signature] = valid
+        return valid
+    
+    def _purge_expired(self):
+        """Удаление метрик и состояния серверов, не обновлявшихся дольше SERVER_METRICS_TTL"""
+        cutoff_ns = time.monotonic_ns() - settings.SERVER_METRICS_TTL * 1_000_000_000
+        expired = [server_id for server_id, last_ns in self.last_collection.items() if last_ns <= cutoff_ns]
+        for server_id in expired:
+            del self.last_collection[server_id]
+            self._validated_server_ids.pop(server_id, None)
+            self._metric_slots.pop(server_id, None)
+            self._latency_hist.pop(server_id, None)
+        # Кэш мог не обновиться и при свежем сборе, если метрики не прошли проверку
+        stale = [server_id for server_id, cached in self.metrics_cache.items() if cached.ts_ns <= cutoff_ns]
+        for server_id in stale:
+            del self.metrics_cache[server_id]
+    
+    def store_metrics(self, server_id: str, payload: bytes):
+        """Постановка сериализованных метрик сервера в пакет на сохранение"""
+        self._pending_metrics.append((server_id, payload))
+    
+    async def flush_metrics(self):
+        """Сохранение накопленных метрик в базу данных одним пакетом"""
+        if not self._pending_metrics:
+            return
+        batch, self._pending_metrics = self._pending_metrics, []
         try:
-            # Здесь должна быть логика сохранения в базу данных
-            # Для примера просто логируем
-            logger.debug(f"[Server Monitor] Сохранение метрик: {metrics['server_id']}")
-            
-            # В реальной реализации здесь будет:
-            # await database.store_server_metrics(metrics)
+            # Здесь должна быть логика пакетной вставки строк (server_id, payload) в базу данных:
+            # один запрос на цикл вместо запроса на каждый сервер
+            logger.debug(f"[Server Monitor] Сохранение метрик: {len(batch)} серверов")
             
         except Exception as e:
             logger.error(f"[Server Monitor] Ошибка сохранения метрик: {e}")
     
-    async def get_server_health_score(self, server_id: str) -> float:
+    def get_metrics_json(self, server_id: str) -> Optional[bytes]:
+        """Последние метрики сервера в JSON без повторной сериализации"""
+        cached = self.metrics_cache.get(server_id)
+        return cached.payload_bytes if cached else None
+    
+    def compute_all_health_scores(self) -> Dict[str, float]:
+        """Индексы здоровья всех серверов из кэша одним векторным расчетом"""
+        try:
+            server_ids = list(self.metrics_cache)
+            if not server_ids:
+                return {}
+            
+            # Матрица (серверов x показателей)
+            raw = np.array([
+                (cached.cpu, cached.mem, cached.disk, cached.latency, cached.err)
+                for cached in self.metrics_cache.values()
+            ], dtype=np.float64)
+            scores = np.maximum(0, 100 - raw * self._HEALTH_SCALES) @ self._HEALTH_WEIGHTS
+            
+            return dict(zip(server_ids, np.round(scores, 2).tolist()))
+            
+        except Exception as e:
+            logger.error(f"[Server Monitor] Ошибка расчета индексов здоровья: {e}")
+            return {}
+    
+    def get_server_health_score(self, server_id: str) -> float:
         """Расчет общего индекса здоровья сервера"""
         try:
-            if server_id not in self.metrics_cache:
+            cached = self.metrics_cache.get(server_id)
+            if cached is None:
                 return 0.0
             
-            metrics = self.metrics_cache[server_id]["data"]
-            system = metrics.get("system_metrics", {})
-            quality = metrics.get("quality_metrics", {})
-            
             # Рассчитываем индекс здоровья (0-100)
-            cpu_score = max(0, 100 - system.get("cpu_usage_percent", 0))
-            memory_score = max(0, 100 - system.get("memory_usage_percent", 0))
-            disk_score = max(0, 100 - system.get("disk_usage_percent", 0))
-            latency_score = max(0, 100 - (quality.get("avg_latency_ms", 0) / 10))
-            error_score = max(0, 100 - quality.get("error_rate_percent", 0) * 10)
+            cpu_score = max(0, 100 - cached.cpu)
+            memory_score = max(0, 100 - cached.mem)
+            disk_score = max(0, 100 - cached.disk)
+            latency_score = max(0, 100 - (cached.latency / 10))
+            error_score = max(0, 100 - cached.err * 10)
             
             # Средневзвешенный индекс
             health_score = (
@@ -332,24 +667,24 @@ class ServerMonitor:
             logger.error(f"[Server Monitor] Ошибка расчета индекса здоровья: {e}")
             return 0.0
     
-    async def get_server_summary(self, server_id: str) -> Dict[str, Any]:
+    def get_server_summary(self, server_id: str) -> Dict[str, Any]:
         """Получение сводки по серверу"""
         try:
-            if server_id not in self.metrics_cache:
+            cached = self.metrics_cache.get(server_id)
+            if cached is None:
                 return {"status": "no_data"}
             
-            metrics = self.metrics_cache[server_id]["data"]
-            health_score = await self.get_server_health_score(server_id)
+            health_score = self.get_server_health_score(server_id)
             
             return {
                 "server_id": server_id,
-                "status": "online" if health_score > 70 else "warning" if health_score > 40 else "critical",
+                "status": _STATUS[min(9, max(0, int(-(-health_score // 10)) - 1))],
                 "health_score": health_score,
-                "last_update": metrics["timestamp"],
-                "active_connections": metrics.get("vpn_metrics", {}).get("total_connections", 0),
-                "bandwidth_usage_gb": metrics.get("vpn_metrics", {}).get("total_bandwidth_gb", 0),
-                "cpu_usage": metrics.get("system_metrics", {}).get("cpu_usage_percent", 0),
-                "memory_usage": metrics.get("system_metrics", {}).get("memory_usage_percent", 0)
+                "last_update": cached.timestamp.isoformat(),
+                "active_connections": cached.conns,
+                "bandwidth_usage_gb": cached.bw_gb,
+                "cpu_usage": cached.cpu,
+                "memory_usage": cached.mem
             }
             
         except Exception as e:
@@ -5,7 +5,7 @@
 from .privacy_checker import PrivacyChecker, PrivacyComplianceChecker
 from .data_anonymizer import DataAnonymizer
 from .gdpr_compliance import GDPRCompliance
-from .audit_logger import AuditLogger, AuditEventType, AuditSeverity
+from .audit_logger import AuditLogger, AuditEventType, AuditSeverity, anonymize_user_id
 from .consent_manager import ConsentManager, ConsentStatus, ConsentPurpose, ConsentMethod
 from .data_retention import DataRetentionManager, DataCategory, RetentionPolicy
 from .privacy_policy import PrivacyPolicyManager, PrivacyLevel, DataSubject, LegalBasis
@@ -18,6 +18,7 @@ __all__ = [
     "AuditLogger",
     "AuditEventType",
     "AuditSeverity",
+    "anonymize_user_id",
     "ConsentManager",
     "ConsentStatus",
     "ConsentPurpose",
@@ -2,15 +2,46 @@
 Система аудита для соблюдения приватности
 """
 
-import json
+import asyncio
+import csv
+import gzip
 import hashlib
+import io
+import itertools
+import os
+import time
+from functools import lru_cache
+from collections import Counter, defaultdict, deque
+from dataclasses import dataclass
 from datetime import datetime, timedelta
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Tuple, Union
 from enum import Enum
 
+import orjson
+
 from .. import settings
 from logger import logger
 
+# Соль для анонимизации ID пользователей в логе аудита
+_AUDIT_SALT = b"audit_salt"
+
+# Анонимизированные поля соединения: одинаковы у всех событий
+_REDACTED_FIELDS = {
+    "ip_address": "***.***.***.***",  # Анонимизированный IP
+    "user_agent": "***",  # Анонимизированный User-Agent
+    "session_id": "***"  # Анонимизированный Session ID
+}
+# Общие пустые metadata для событий без них; не изменять
+_NO_METADATA: Dict[str, Any] = {}
+
+
+@lru_cache(maxsize=4096)
+def anonymize_user_id(user_id: str) -> str:
+    """Анонимизация ID пользователя (кешируется: активные пользователи повторяются)"""
+    # Создаем детерминированный анонимный ID; числовые ID приводим к строке
+    hash_object = hashlib.sha256(str(user_id).encode() + _AUDIT_SALT)
+    return f"user_{hash_object.hexdigest()[:12]}"
+
 
 class AuditEventType(Enum):
     """Типы событий аудита"""
@@ -34,53 +65,218 @@ class AuditSeverity(Enum):
     CRITICAL = "critical"
 
 
+@dataclass(slots=True)
+class AuditEntry:
+    """Запись буфера аудита: поля для фильтров и событие, сериализованное в JSON"""
+    event_type: str
+    severity: str
+    user_id: Optional[str]
+    ts: float  # Время события, epoch — для сравнений без разбора строки
+    payload: bytes
+    integrity_hash: str
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """Событие в виде словаря"""
+        event = orjson.loads(self.payload)
+        event["integrity_hash"] = self.integrity_hash
+        return event
+
+
 class AuditLogger:
     """Система аудита для соблюдения приватности"""
     
+    # Очередь событий на запись и размер пакета; пакет закрывается по размеру
+    # или по истечении ожидания (секунды), пока ждем — короткий сон
+    QUEUE_SIZE = 10000
+    BATCH_SIZE = 500
+    BATCH_WAIT = 0.2
+    POLL_INTERVAL = 0.05
+    # Колонки CSV-экспорта
+    _CSV_FIELDS = ("id", "timestamp", "event_type", "description", "user_id",
+                   "resource", "severity", "ip_address", "user_agent", "session_id",
+                   "metadata", "integrity_hash")
+    # Уровень gzip для сжатого экспорта: текст лога хорошо жмется уже на низких уровнях
+    EXPORT_COMPRESSLEVEL = 3
+    
     def __init__(self):
-        self.audit_log = []
         self.retention_days = settings.AUDIT_LOG_RETENTION_DAYS
         self.max_log_size = 10000
+        # Кольцевой буфер записей AuditEntry: события хранятся сериализованными
+        # (байты JSON компактнее словарей), при переполнении старые вытесняются сами
+        self.audit_log = deque(maxlen=self.max_log_size)
+        # Индексы по типу, серьезности и пользователю: ссылки на те же записи
+        # в порядке добавления, старые удаляются вместе с вытеснением из буфера
+        self._by_type: Dict[str, deque] = defaultdict(deque)
+        self._by_severity: Dict[str, deque] = defaultdict(deque)
+        self._by_user: Dict[str, deque] = defaultdict(deque)
+        # Хеширование и запись событий выполняет фоновая задача пакетами
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=self.QUEUE_SIZE)
+        self._writer_task: Optional[asyncio.Task] = None
+        # Сигнал фоновой задаче о новых событиях; сами события остаются в очереди
+        # до записи, поэтому чтение после flush() видит все принятые события
+        self._pending = asyncio.Event()
+        self._stopped = False
+        # ID событий: префикс процесса и момента запуска плюс счетчик — уникальны
+        # и при нескольких событиях за одну микросекунду
+        self._id_prefix = f"audit_{os.getpid()}_{int(time.time())}_"
+        self._id_counter = itertools.count(1)
+    
+    async def stop(self):
+        """Остановка фоновой записи с сохранением событий, оставшихся в очереди
+        
+        После остановки новые события не принимаются
+        """
+        self._stopped = True
+        if self._writer_task:
+            self._writer_task.cancel()
+            try:
+                await self._writer_task
+            except asyncio.CancelledError:
+                pass
+            self._writer_task = None
+        await self.flush()
+    
+    async def flush(self):
+        """Немедленная запись всех событий, ожидающих в очереди
+        
+        Выполняется без переключений цикла событий: после возврата в буфере
+        все принятые события
+        """
+        while not self._queue.empty():
+            batch = []
+            while len(batch) < self.BATCH_SIZE and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            self._write_batch(batch)
+    
+    async def _drain(self):
+        """Фоновая запись событий аудита пакетами"""
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._pending.wait()
+            self._pending.clear()
+            # Добираем пакет: до его размера или до конца ожидания
+            deadline = loop.time() + self.BATCH_WAIT
+            while self._queue.qsize() < self.BATCH_SIZE:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                await asyncio.sleep(min(self.POLL_INTERVAL, remaining))
+            await self.flush()
+    
+    def _write_batch(self, batch: List[Tuple[Dict[str, Any], float]]):
+        """Сериализация и хеширование пакета событий, добавление в лог аудита
+        
+        Ошибка одного события не теряет остальные события пакета
+        """
+        # blake2b по сотням байт — микросекунды на событие: пакет хешируем
+        # прямо здесь, пересылка в поток обошлась бы дороже
+        for event, ts in batch:
+            try:
+                entry = self._make_entry(event, ts)
+                # Логируем в основной лог; loguru подставит аргументы в шаблон,
+                # только если уровень INFO принимает хотя бы один приемник
+                logger.info("[Audit] {}: {}", event["event_type"], event["description"])
+                self._append_entry(entry)
+            except Exception as e:
+                logger.error(f"[Audit Logger] Ошибка записи события {event.get('event_type')}: {e}")
+    
+    def _entry_indexes(self, entry: AuditEntry) -> List[tuple]:
+        """Индексы и ключи, под которыми учитывается запись"""
+        indexes = [(self._by_type, entry.event_type), (self._by_severity, entry.severity)]
+        if entry.user_id:
+            indexes.append((self._by_user, entry.user_id))
+        return indexes
+    
+    def _append_entry(self, entry: AuditEntry):
+        """Добавление записи в буфер и индексы"""
+        if len(self.audit_log) == self.max_log_size:
+            # Вытесняемая запись — самая старая и в каждом из своих индексов
+            for index, key in self._entry_indexes(self.audit_log[0]):
+                index[key].popleft()
+                if not index[key]:
+                    del index[key]
+        
+        self.audit_log.append(entry)
+        for index, key in self._entry_indexes(entry):
+            index[key].append(entry)
+    
+    def _rebuild_indexes(self):
+        """Перестроение индексов по текущему содержимому буфера"""
+        self._by_type.clear()
+        self._by_severity.clear()
+        self._by_user.clear()
+        for entry in self.audit_log:
+            for index, key in self._entry_indexes(entry):
+                index[key].append(entry)
         
+    def _make_entry(self, event: Dict[str, Any], ts: float) -> AuditEntry:
+        """Сериализация и хеширование одного события"""
+        payload = orjson.dumps(event, default=str, option=orjson.OPT_NON_STR_KEYS)
+        return AuditEntry(
+            event_type=event["event_type"],
+            severity=event["severity"],
+            user_id=event["user_id"],
+            ts=ts,
+            payload=payload,
+            integrity_hash=self._calculate_integrity_hash(payload)
+        )
+    
     async def log_event(self, 
                        event_type: AuditEventType,
                        description: str,
                        user_id: Optional[str] = None,
                        resource: Optional[str] = None,
                        severity: AuditSeverity = AuditSeverity.MEDIUM,
-                       metadata: Optional[Dict[str, Any]] = None) -> str:
-        """Логирование события аудита"""
+                       metadata: Optional[Dict[str, Any]] = None,
+                       timestamp_key: Optional[str] = None) -> str:
+        """Логирование события аудита
+        
+        timestamp_key — ключ metadata, в который проставляется время события
+        (если вызывающий не задал его сам)
+        """
+        if self._stopped:
+            logger.warning("[Audit Logger] Логгер аудита остановлен, событие отброшено")
+            return ""
+        
         try:
-            event_id = f"audit_{datetime.utcnow().strftime('%Y%m%d_%H%M%S_%f')}"
+            event_id = f"{self._id_prefix}{next(self._id_counter)}"
+            
+            # Один момент времени на метку события и metadata
+            now = datetime.utcnow()
+            timestamp = now.isoformat()
+            
+            if timestamp_key:
+                metadata = {} if metadata is None else metadata
+                metadata.setdefault(timestamp_key, timestamp)
+            elif not metadata:
+                metadata = _NO_METADATA
             
             # Анонимизируем пользователя, если указан
-            anonymized_user_id = await self._anonymize_user_id(user_id) if user_id else None
+            anonymized_user_id = self._anonymize_user_id(user_id) if user_id else None
             
             event = {
                 "id": event_id,
-                "timestamp": datetime.utcnow().isoformat(),
+                "timestamp": timestamp,
                 "event_type": event_type.value,
                 "description": description,
                 "user_id": anonymized_user_id,
                 "resource": resource,
                 "severity": severity.value,
-                "metadata": metadata or {},
-                "ip_address": "***.***.***.***",  # Анонимизированный IP
-                "user_agent": "***",  # Анонимизированный User-Agent
-                "session_id": "***"  # Анонимизированный Session ID
+                "metadata": metadata,
+                **_REDACTED_FIELDS
             }
             
-            # Добавляем хеш для целостности
-            event["integrity_hash"] = await self._calculate_integrity_hash(event)
-            
-            self.audit_log.append(event)
-            
-            # Ограничиваем размер лога
-            if len(self.audit_log) > self.max_log_size:
-                self.audit_log = self.audit_log[-self.max_log_size//2:]
+            # Хеш и запись — в фоновой задаче; ее запускаем при первом событии,
+            # когда цикл событий уже работает
+            if self._writer_task is None or self._writer_task.done():
+                self._writer_task = asyncio.create_task(self._drain())
             
-            # Логируем в основной лог
-            logger.info(f"[Audit] {event_type.value}: {description}")
+            try:
+                self._queue.put_nowait((event, now.timestamp()))
+            except asyncio.QueueFull:
+                logger.warning(f"[Audit Logger] Очередь аудита переполнена, событие {event_id} отброшено")
+                return ""
+            self._pending.set()
             
             return event_id
             
@@ -94,93 +290,80 @@ class AuditLogger:
                              data_categories: Optional[List[str]] = None,
                              purpose: Optional[str] = None) -> str:
         """Логирование доступа к данным"""
-        try:
-            description = f"Доступ к ресурсу: {resource}"
-            if data_categories:
-                description += f", категории данных: {', '.join(data_categories)}"
-            if purpose:
-                description += f", цель: {purpose}"
-            
-            metadata = {
-                "resource": resource,
-                "data_categories": data_categories or [],
-                "purpose": purpose,
-                "access_method": "api",
-                "data_volume": "unknown"
-            }
-            
-            return await self.log_event(
-                event_type=AuditEventType.DATA_ACCESS,
-                description=description,
-                user_id=user_id,
-                resource=resource,
-                severity=AuditSeverity.MEDIUM,
-                metadata=metadata
-            )
-            
-        except Exception as e:
-            logger.error(f"[Audit Logger] Ошибка логирования доступа к данным: {e}")
-            return ""
+        description = "".join((
+            f"Доступ к ресурсу: {resource}",
+            f", категории данных: {', '.join(data_categories)}" if data_categories else "",
+            f", цель: {purpose}" if purpose else "",
+        ))
+        
+        metadata = {
+            "resource": resource,
+            "data_categories": data_categories or [],
+            "purpose": purpose,
+            "access_method": "api",
+            "data_volume": "unknown"
+        }
+        
+        return await self.log_event(
+            event_type=AuditEventType.DATA_ACCESS,
+            description=description,
+            user_id=user_id,
+            resource=resource,
+            severity=AuditSeverity.MEDIUM,
+            metadata=metadata
+        )
     
     async def log_data_modification(self, 
                                    resource: str,
                                    user_id: Optional[str] = None,
                                    changes: Optional[Dict[str, Any]] = None) -> str:
         """Логирование изменения данных"""
-        try:
-            description = f"Изменение ресурса: {resource}"
-            if changes:
-                description += f", изменений: {len(changes)}"
-            
-            metadata = {
-                "resource": resource,
-                "changes": changes or {},
-                "change_type": "update",
-                "backup_created": True
-            }
-            
-            return await self.log_event(
-                event_type=AuditEventType.DATA_MODIFICATION,
-                description=description,
-                user_id=user_id,
-                resource=resource,
-                severity=AuditSeverity.HIGH,
-                metadata=metadata
-            )
-            
-        except Exception as e:
-            logger.error(f"[Audit Logger] Ошибка логирования изменения данных: {e}")
-            return ""
+        description = "".join((
+            f"Изменение ресурса: {resource}",
+            f", изменений: {len(changes)}" if changes else "",
+        ))
+        
+        metadata = {
+            "resource": resource,
+            "changes": changes or {},
+            "change_type": "update",
+            "backup_created": True
+        }
+        
+        return await self.log_event(
+            event_type=AuditEventType.DATA_MODIFICATION,
+            description=description,
+            user_id=user_id,
+            resource=resource,
+            severity=AuditSeverity.HIGH,
+            metadata=metadata
+        )
     
     async def log_data_deletion(self, 
                                resource: str,
                                user_id: Optional[str] = None,
                                data_categories: Optional[List[str]] = None) -> str:
         """Логирование удаления данных"""
-        try:
-            description = f"Удаление ресурса: {resource}"
-            if data_categories:
-                description += f", категории данных: {', '.join(data_categories)}"
-            
-            metadata = {
-                "resource": resource,
-                "data_categories": data_categories or [],
-                "deletion_method": "soft_delete",
-                "backup_available": True
-            }
-            
-            return await self.log_event(
-                event_type=AuditEventType.DATA_DELETION,
-                description=description,
-                user_id=user_id,
-                resource=resource,
-                severity=AuditSeverity.HIGH,
-                metadata=metadata
-            )
-            
-        except Exception as e:
-            logger.error(f"[Audit Logger] Ошибка логирования удаления данных: {e}")
-            return ""
+        description = "".join((
+            f"Удаление ресурса: {resource}",
+            f", категории данных: {', '.join(data_categories)}" if data_categories else "",
+        ))
+        
+        metadata = {
+            "resource": resource,
+            "data_categories": data_categories or [],
+            "deletion_method": "soft_delete",
+            "backup_available": True
+        }
+        
+        return await self.log_event(
+            event_type=AuditEventType.DATA_DELETION,
+            description=description,
+            user_id=user_id,
+            resource=resource,
+            severity=AuditSeverity.HIGH,
+            metadata=metadata
+        )
     
     async def log_privacy_check(self, 
                                data_hash: str,
@@ -188,85 +371,71 @@ class AuditLogger:
                                privacy_level: str,
                                violations: Optional[List[str]] = None) -> str:
         """Логирование проверки приватности"""
-        try:
-            description = f"Проверка приватности: {'соответствует' if compliance_result else 'нарушения обнаружены'}"
-            if violations:
-                description += f", нарушений: {len(violations)}"
-            
-            metadata = {
-                "data_hash": data_hash,
-                "compliance_result": compliance_result,
-                "privacy_level": privacy_level,
-                "violations": violations or [],
-                "check_method": "automated"
-            }
-            
-            return await self.log_event(
-                event_type=AuditEventType.PRIVACY_CHECK,
-                description=description,
-                severity=AuditSeverity.HIGH if not compliance_result else AuditSeverity.LOW,
-                metadata=metadata
-            )
-            
-        except Exception as e:
-            logger.error(f"[Audit Logger] Ошибка логирования проверки приватности: {e}")
-            return ""
+        description = "".join((
+            f"Проверка приватности: {'соответствует' if compliance_result else 'нарушения обнаружены'}",
+            f", нарушений: {len(violations)}" if violations else "",
+        ))
+        
+        metadata = {
+            "data_hash": data_hash,
+            "compliance_result": compliance_result,
+            "privacy_level": privacy_level,
+            "violations": violations or [],
+            "check_method": "automated"
+        }
+        
+        return await self.log_event(
+            event_type=AuditEventType.PRIVACY_CHECK,
+            description=description,
+            severity=AuditSeverity.HIGH if not compliance_result else AuditSeverity.LOW,
+            metadata=metadata
+        )
     
     async def log_consent_given(self, 
                                subject_id: str,
                                purpose: str,
                                consent_method: str = "explicit") -> str:
         """Логирование предоставления согласия"""
-        try:
-            description = f"Согласие предоставлено субъектом {subject_id} для цели: {purpose}"
-            
-            metadata = {
-                "subject_id": subject_id,
-                "purpose": purpose,
-                "consent_method": consent_method,
-                "consent_timestamp": datetime.utcnow().isoformat(),
-                "withdrawable": True
-            }
-            
-            return await self.log_event(
-                event_type=AuditEventType.CONSENT_GIVEN,
-                description=description,
-                user_id=subject_id,
-                severity=AuditSeverity.MEDIUM,
-                metadata=metadata
-            )
-            
-        except Exception as e:
-            logger.error(f"[Audit Logger] Ошибка логирования согласия: {e}")
-            return ""
+        description = f"Согласие предоставлено субъектом {subject_id} для цели: {purpose}"
+        
+        metadata = {
+            "subject_id": subject_id,
+            "purpose": purpose,
+            "consent_method": consent_method,
+            "withdrawable": True
+        }
+        
+        return await self.log_event(
+            event_type=AuditEventType.CONSENT_GIVEN,
+            description=description,
+            user_id=subject_id,
+            severity=AuditSeverity.MEDIUM,
+            metadata=metadata,
+            timestamp_key="consent_timestamp"
+        )
     
     async def log_consent_withdrawn(self, 
                                    subject_id: str,
                                    purpose: str,
                                    withdrawal_method: str = "explicit") -> str:
         """Логирование отзыва согласия"""
-        try:
-            description = f"Согласие отозвано субъектом {subject_id} для цели: {purpose}"
-            
-            metadata = {
-                "subject_id": subject_id,
-                "purpose": purpose,
-                "withdrawal_method": withdrawal_method,
-                "withdrawal_timestamp": datetime.utcnow().isoformat(),
-                "data_retention_updated": True
-            }
-            
-            return await self.log_event(
-                event_type=AuditEventType.CONSENT_WITHDRAWN,
-                description=description,
-                user_id=subject_id,
-                severity=AuditSeverity.HIGH,
-                metadata=metadata
-            )
-            
-        except Exception as e:
-            logger.error(f"[Audit Logger] Ошибка логирования отзыва согласия: {e}")
-            return ""
+        description = f"Согласие отозвано субъектом {subject_id} для цели: {purpose}"
+        
+        metadata = {
+            "subject_id": subject_id,
+            "purpose": purpose,
+            "withdrawal_method": withdrawal_method,
+            "data_retention_updated": True
+        }
+        
+        return await self.log_event(
+            event_type=AuditEventType.CONSENT_WITHDRAWN,
+            description=description,
+            user_id=subject_id,
+            severity=AuditSeverity.HIGH,
+            metadata=metadata,
+            timestamp_key="withdrawal_timestamp"
+        )
     
     async def log_data_breach(self, 
                              description: str,
@@ -274,28 +443,23 @@ class AuditLogger:
                              data_categories: Optional[List[str]] = None,
                              severity: AuditSeverity = AuditSeverity.HIGH) -> str:
         """Логирование нарушения данных"""
-        try:
-            full_description = f"Нарушение данных: {description}, затронуто субъектов: {affected_subjects}"
-            
-            metadata = {
-                "breach_description": description,
-                "affected_subjects": affected_subjects,
-                "data_categories": data_categories or [],
-                "breach_timestamp": datetime.utcnow().isoformat(),
-                "reported_to_authorities": False,
-                "notified_subjects": False
-            }
-            
-            return await self.log_event(
-                event_type=AuditEventType.DATA_BREACH,
-                description=full_description,
-                severity=severity,
-                metadata=metadata
-            )
-            
-        except Exception as e:
-            logger.error(f"[Audit Logger] Ошибка логирования нарушения данных: {e}")
-            return ""
+        full_description = f"Нарушение данных: {description}, затронуто субъектов: {affected_subjects}"
+        
+        metadata = {
+            "breach_description": description,
+            "affected_subjects": affected_subjects,
+            "data_categories": data_categories or [],
+            "reported_to_authorities": False,
+            "notified_subjects": False
+        }
+        
+        return await self.log_event(
+            event_type=AuditEventType.DATA_BREACH,
+            description=full_description,
+            severity=severity,
+            metadata=metadata,
+            timestamp_key="breach_timestamp"
+        )
     
     async def log_admin_action(self, 
                               action: str,
@@ -303,31 +467,27 @@ class AuditLogger:
                               target_resource: Optional[str] = None,
                               changes: Optional[Dict[str, Any]] = None) -> str:
         """Логирование административных действий"""
-        try:
-            description = f"Административное действие: {action}"
-            if target_resource:
-                description += f", ресурс: {target_resource}"
-            
-            metadata = {
-                "action": action,
-                "admin_id": admin_id,
-                "target_resource": target_resource,
-                "changes": changes or {},
-                "action_timestamp": datetime.utcnow().isoformat()
-            }
-            
-            return await self.log_event(
-                event_type=AuditEventType.ADMIN_ACTION,
-                description=description,
-                user_id=admin_id,
-                resource=target_resource,
-                severity=AuditSeverity.HIGH,
-                metadata=metadata
-            )
-            
-        except Exception as e:
-            logger.error(f"[Audit Logger] Ошибка логирования административного действия: {e}")
-            return ""
+        description = "".join((
+            f"Административное действие: {action}",
+            f", ресурс: {target_resource}" if target_resource else "",
+        ))
+        
+        metadata = {
+            "action": action,
+            "admin_id": admin_id,
+            "target_resource": target_resource,
+            "changes": changes or {},
+        }
+        
+        return await self.log_event(
+            event_type=AuditEventType.ADMIN_ACTION,
+            description=description,
+            user_id=admin_id,
+            resource=target_resource,
+            severity=AuditSeverity.HIGH,
+            metadata=metadata,
+            timestamp_key="action_timestamp"
+        )
     
     async def log_user_action(self, 
                              action: str,
@@ -335,31 +495,27 @@ class AuditLogger:
                              resource: Optional[str] = None,
                              metadata: Optional[Dict[str, Any]] = None) -> str:
         """Логирование действий пользователя"""
-        try:
-            description = f"Действие пользователя: {action}"
-            if resource:
-                description += f", ресурс: {resource}"
-            
-            action_metadata = {
-                "action": action,
-                "user_id": user_id,
-                "resource": resource,
-                "action_timestamp": datetime.utcnow().isoformat(),
-                **(metadata or {})
-            }
-            
-            return await self.log_event(
-                event_type=AuditEventType.USER_ACTION,
-                description=description,
-                user_id=user_id,
-                resource=resource,
-                severity=AuditSeverity.MEDIUM,
-                metadata=action_metadata
-            )
-            
-        except Exception as e:
-            logger.error(f"[Audit Logger] Ошибка логирования действия пользователя: {e}")
-            return ""
+        description = "".join((
+            f"Действие пользователя: {action}",
+            f", ресурс: {resource}" if resource else "",
+        ))
+        
+        action_metadata = {
+            "action": action,
+            "user_id": user_id,
+            "resource": resource,
+            **(metadata or {})
+        }
+        
+        return await self.log_event(
+            event_type=AuditEventType.USER_ACTION,
+            description=description,
+            user_id=user_id,
+            resource=resource,
+            severity=AuditSeverity.MEDIUM,
+            metadata=action_metadata,
+            timestamp_key="action_timestamp"
+        )
     
     async def log_system_event(self, 
                               event: str,
@@ -367,56 +523,31 @@ class AuditLogger:
                               severity: AuditSeverity = AuditSeverity.MEDIUM,
                               metadata: Optional[Dict[str, Any]] = None) -> str:
         """Логирование системных событий"""
-        try:
-            description = f"Системное событие: {event}, компонент: {component}"
-            
-            event_metadata = {
-                "event": event,
-                "component": component,
-                "event_timestamp": datetime.utcnow().isoformat(),
-                "system_version": "1.0.0",
-                **(metadata or {})
-            }
-            
-            return await self.log_event(
-                event_type=AuditEventType.SYSTEM_EVENT,
-                description=description,
-                severity=severity,
-                metadata=event_metadata
-            )
-            
-        except Exception as e:
-            logger.error(f"[Audit Logger] Ошибка логирования системного события: {e}")
-            return ""
+        description = f"Системное событие: {event}, компонент: {component}"
+        
+        event_metadata = {
+            "event": event,
+            "component": component,
+            "system_version": "1.0.0",
+            **(metadata or {})
+        }
+        
+        return await self.log_event(
+            event_type=AuditEventType.SYSTEM_EVENT,
+            description=description,
+            severity=severity,
+            metadata=event_metadata,
+            timestamp_key="event_timestamp"
+        )
     
-    async def _anonymize_user_id(self, user_id: str) -> str:
-        """Анонимизация ID пользователя"""
-        try:
-            # Создаем детерминированный анонимный ID
-            hash_object = hashlib.sha256((user_id + "audit_salt").encode())
-            return f"user_{hash_object.hexdigest()[:12]}"
-            
-        except Exception as e:
-            logger.error(f"[Audit Logger] Ошибка анонимизации ID пользователя: {e}")
-            return "anonymous_user"
+    # Тот же анонимный ID используют и другие модули (мониторинг безопасности)
+    _anonymize_user_id = staticmethod(anonymize_user_id)
     
-    async def _calculate_integrity_hash(self, event: Dict[str, Any]) -> str:
-        """Расчет хеша целостности события"""
-        try:
-            # Создаем копию события без хеша
-            event_copy = event.copy()
-            event_copy.pop("integrity_hash", None)
-            
-            # Сортируем ключи для детерминированного хеша
-            sorted_event = json.dumps(event_copy, sort_keys=True, ensure_ascii=False)
-            
-            # Создаем хеш
-            hash_object = hashlib.sha256(sorted_event.encode())
-            return hash_object.hexdigest()
-            
-        except Exception as e:
-            logger.error(f"[Audit Logger] Ошибка расчета хеша целостности: {e}")
-            return ""
+    @staticmethod
+    def _calculate_integrity_hash(payload: bytes) -> str:
+        """Расчет хеша целостности по сериализованному событию"""
+        # Метка целостности внутри процесса: blake2b заметно быстрее SHA-256
+        return hashlib.blake2b(payload, digest_size=16).hexdigest()
     
     async def get_audit_log(self, 
                            event_type: Optional[AuditEventType] = None,
@@ -427,33 +558,53 @@ class AuditLogger:
                            limit: int = 100) -> List[Dict[str, Any]]:
         """Получение лога аудита с фильтрацией"""
         try:
-            filtered_log = self.audit_log.copy()
-            
-            # Фильтр по типу события
-            if event_type:
-                filtered_log = [event for event in filtered_log if event["event_type"] == event_type.value]
-            
-            # Фильтр по серьезности
-            if severity:
-                filtered_log = [event for event in filtered_log if event["severity"] == severity.value]
-            
-            # Фильтр по пользователю
-            if user_id:
-                anonymized_user_id = await self._anonymize_user_id(user_id)
-                filtered_log = [event for event in filtered_log if event.get("user_id") == anonymized_user_id]
-            
-            # Фильтр по дате
-            if start_date:
-                filtered_log = [event for event in filtered_log if datetime.fromisoformat(event["timestamp"]) >= start_date]
-            
-            if end_date:
-                filtered_log = [event for event in filtered_log if datetime.fromisoformat(event["timestamp"]) <= end_date]
-            
-            # Сортируем по времени (новые сначала)
-            filtered_log.sort(key=lambda x: x["timestamp"], reverse=True)
-            
-            # Ограничиваем количество
-            return filtered_log[:limit]
+            # Сначала записываем ожидающие события, чтобы их было видно в выборке
+            await self.flush()
+            
+            if limit <= 0:
+                return []
+            
+            type_value = event_type.value if event_type else None
+            severity_value = severity.value if severity else None
+            anonymized_user_id = self._anonymize_user_id(user_id) if user_id else None
+            start_ts = start_date.timestamp() if start_date else None
+            end_ts = end_date.timestamp() if end_date else None
+            
+            # Обходим самый короткий из подходящих индексов (или весь буфер);
+            # условие выбранного индекса выполнено заранее, в цикле его не проверяем
+            filters = {"event_type": type_value, "severity": severity_value, "user_id": anonymized_user_id}
+            indexes = {"event_type": self._by_type, "severity": self._by_severity, "user_id": self._by_user}
+            source, indexed_field = self.audit_log, None
+            for field, value in filters.items():
+                if value:
+                    events = indexes[field].get(value, ())
+                    if len(events) < len(source):
+                        source, indexed_field = events, field
+            if indexed_field:
+                filters[indexed_field] = None
+            type_value, severity_value, anonymized_user_id = filters.values()
+            
+            # События лежат в порядке времени: идем с конца (новые сначала)
+            # и останавливаемся на лимите или на выходе за начало диапазона
+            filtered_log = []
+            for entry in reversed(source):
+                # Граница по времени — первой: за ней совпадений уже не будет
+                if start_ts is not None and entry.ts < start_ts:
+                    break
+                if end_ts is not None and entry.ts > end_ts:
+                    continue
+                if type_value and entry.event_type != type_value:
+                    continue
+                if severity_value and entry.severity != severity_value:
+                    continue
+                if anonymized_user_id and entry.user_id != anonymized_user_id:
+                    continue
+                filtered_log.append(entry)
+                if len(filtered_log) >= limit:
+                    break
+            
+            # Разбираем JSON только у попавших в результат записей
+            return [entry.to_dict() for entry in filtered_log]
             
         except Exception as e:
             logger.error(f"[Audit Logger] Ошибка получения лога аудита: {e}")
@@ -462,42 +613,31 @@ class AuditLogger:
     async def get_audit_statistics(self) -> Dict[str, Any]:
         """Получение статистики аудита"""
         try:
-            total_events = len(self.audit_log)
-            
-            # Статистика по типам событий
-            event_type_stats = {}
-            for event in self.audit_log:
-                event_type = event["event_type"]
-                event_type_stats[event_type] = event_type_stats.get(event_type, 0) + 1
+            await self.flush()
             
-            # Статистика по серьезности
-            severity_stats = {}
-            for event in self.audit_log:
-                severity = event["severity"]
-                severity_stats[severity] = severity_stats.get(severity, 0) + 1
+            total_events = len(self.audit_log)
             
-            # Статистика за последние 24 часа
-            last_24h = datetime.utcnow() - timedelta(hours=24)
-            recent_events = [
-                event for event in self.audit_log
-                if datetime.fromisoformat(event["timestamp"]) > last_24h
-            ]
+            # Распределения по типам, серьезности и пользователям — размеры индексов
+            event_type_stats = {key: len(events) for key, events in self._by_type.items()}
+            severity_stats = {key: len(events) for key, events in self._by_severity.items()}
+            user_stats = Counter({key: len(events) for key, events in self._by_user.items()})
             
-            # Статистика по пользователям
-            user_stats = {}
-            for event in self.audit_log:
-                user_id = event.get("user_id")
-                if user_id:
-                    user_stats[user_id] = user_stats.get(user_id, 0) + 1
+            # Статистика за последние 24 часа: с конца буфера до первого старого события
+            last_24h = (datetime.utcnow() - timedelta(hours=24)).timestamp()
+            events_24h = 0
+            for entry in reversed(self.audit_log):
+                if entry.ts <= last_24h:
+                    break
+                events_24h += 1
             
             return {
                 "total_events": total_events,
-                "events_24h": len(recent_events),
+                "events_24h": events_24h,
                 "event_type_distribution": event_type_stats,
                 "severity_distribution": severity_stats,
                 "unique_users": len(user_stats),
-                "most_active_users": sorted(user_stats.items(), key=lambda x: x[1], reverse=True)[:10],
-                "last_event": self.audit_log[-1]["timestamp"] if self.audit_log else None
+                "most_active_users": user_stats.most_common(10),
+                "last_event": self.audit_log[-1].to_dict()["timestamp"] if self.audit_log else None
             }
             
         except Exception as e:
@@ -507,13 +647,16 @@ class AuditLogger:
     async def cleanup_old_logs(self):
         """Очистка старых логов"""
         try:
-            cutoff_date = datetime.utcnow() - timedelta(days=self.retention_days)
+            await self.flush()
+            
+            cutoff = (datetime.utcnow() - timedelta(days=self.retention_days)).timestamp()
             
             # Удаляем старые записи
-            self.audit_log = [
-                event for event in self.audit_log
-                if datetime.fromisoformat(event["timestamp"]) > cutoff_date
-            ]
+            self.audit_log = deque(
+                (entry for entry in self.audit_log if entry.ts > cutoff),
+                maxlen=self.max_log_size
+            )
+            self._rebuild_indexes()
             
             logger.info(f"[Audit Logger] Очищено {len(self.audit_log)} записей аудита")
             
@@ -523,8 +666,12 @@ class AuditLogger:
     async def export_audit_log(self, 
                               start_date: Optional[datetime] = None,
                               end_date: Optional[datetime] = None,
-                              format: str = "json") -> str:
-        """Экспорт лога аудита"""
+                              format: str = "json",
+                              compress: bool = False) -> Union[str, bytes]:
+        """Экспорт лога аудита
+        
+        При compress=True возвращает байты gzip вместо строки
+        """
         try:
             # Получаем отфильтрованный лог
             filtered_log = await self.get_audit_log(
@@ -534,13 +681,37 @@ class AuditLogger:
             )
             
             if format == "json":
-                return json.dumps(filtered_log, ensure_ascii=False, indent=2)
+                data = orjson.dumps(filtered_log,
+                                    option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+                if compress:
+                    return gzip.compress(data, compresslevel=self.EXPORT_COMPRESSLEVEL)
+                return data.decode()
             elif format == "csv":
-                # В реальной реализации здесь должна быть конвертация в CSV
-                return "CSV export not implemented"
+                # Сжатый CSV пишем построчно сразу в gzip, без промежуточной строки
+                if compress:
+                    buffer = io.BytesIO()
+                    stream = io.TextIOWrapper(
+                        gzip.GzipFile(fileobj=buffer, mode="wb", compresslevel=self.EXPORT_COMPRESSLEVEL),
+                        encoding="utf-8", newline=""
+                    )
+                else:
+                    buffer = stream = io.StringIO()
+                
+                # Плоские колонки; вложенные metadata — одной JSON-строкой
+                writer = csv.DictWriter(stream, fieldnames=self._CSV_FIELDS, extrasaction="ignore")
+                writer.writeheader()
+                writer.writerows(
+                    {**event, "metadata": orjson.dumps(event.get("metadata") or {},
+                                                       option=orjson.OPT_NON_STR_KEYS).decode()}
+                    for event in filtered_log
+                )
+                if compress:
+                    # Закрытие дописывает хвост gzip; сам buffer остается открытым
+                    stream.close()
+                return buffer.getvalue()
             else:
                 raise ValueError(f"Unsupported format: {format}")
                 
         except Exception as e:
             logger.error(f"[Audit Logger] Ошибка экспорта лога: {e}")
-            return ""
+            return b"" if compress else ""
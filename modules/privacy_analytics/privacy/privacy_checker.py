@@ -388,6 +388,10 @@ class PrivacyComplianceChecker:
             logger.error(f"[Privacy Checker] Ошибка проверки точности временной метки: {e}")
             return False
     
+    async def log_trusted_check(self, data: Dict[str, Any]):
+        """Запись в аудит успешной проверки данных, заранее проверенных по схеме"""
+        await self._log_privacy_check(data, True)
+    
     async def _log_privacy_check(self, data: Dict[str, Any], success: bool, error: str = None):
         """Логирование проверки приватности"""
         try:
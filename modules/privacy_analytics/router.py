@@ -44,8 +44,9 @@ app = FastAPI(
     description="Аналитика и мониторинг с соблюдением приватности"
 )
 
-# Регистрируем API маршруты
-create_api_routes(app)
+# Регистрируем API маршруты; метрики производительности собирает цикл
+# мониторинга ниже, API читает сводку того же монитора
+create_api_routes(app, performance_monitor=performance_monitor)
 
 # Запускаем мониторинг в отдельном потоке
 def start_monitoring():
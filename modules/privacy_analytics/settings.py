@@ -62,6 +62,18 @@ SERVER_MONITORING_INTERVAL = 30
 PERFORMANCE_METRICS_INTERVAL = 60
 HEALTH_CHECK_INTERVAL = 300
 SECURITY_MONITORING_INTERVAL = 120
+BUSINESS_METRICS_INTERVAL = 300
+
+# Метрики сервера, не обновлявшиеся дольше этого срока, удаляются из кэша (секунды)
+SERVER_METRICS_TTL = 600
+
+# Проверка доступности внешних API: группа -> адреса для запроса
+EXTERNAL_API_PROBES = {
+    "payment_apis": ["https://api.yookassa.ru", "https://api.heleket.com"],
+    "telegram_api": ["https://api.telegram.org"]
+}
+EXTERNAL_API_PROBE_TIMEOUT = 2.0
+SERVER_LATENCY_PROBE_TIMEOUT = 2.0  # Замер латентности API серверов, секунды
 
 # ========================================
 # 🚨 ПОРОГОВЫЕ ЗНАЧЕНИЯ ДЛЯ АЛЕРТОВ
@@ -212,6 +224,7 @@ DEFAULT_LANGUAGE = "ru"
 
 # Настройки производительности
 MAX_CONCURRENT_MONITORING_TASKS = 10
+USE_MOCK_METRICS = True  # Тестовые значения для метрик, у которых еще нет источника данных
 METRICS_BATCH_SIZE = 100
 CACHE_TTL_SECONDS = 300
 
@@ -224,6 +237,7 @@ LOG_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
 DB_CONNECTION_POOL_SIZE = 10
 DB_CONNECTION_TIMEOUT = 30
 DB_QUERY_TIMEOUT = 60
+SECURITY_EVENTS_DB = "logs/security_events.db"  # SQLite (WAL) для событий безопасности
 
 # Создаем объект настроек для импорта
 class Settings:
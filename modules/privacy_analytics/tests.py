@@ -2,19 +2,31 @@
 Тесты для модуля Privacy Analytics
 """
 
+import array
 import pytest
 import asyncio
+import csv
+import gzip
+import importlib
+import io
+import json
+import time
 from datetime import datetime, timedelta
-from unittest.mock import Mock, patch
+from unittest.mock import AsyncMock, Mock, patch
 
 # Импорты компонентов модуля
+# Модуль настроек, который читают мониторы: атрибут пакета settings
+# перекрыт одноименным объектом, поэтому берем модуль по имени
+settings = importlib.import_module(f"{__package__}.settings")
 from .monitoring import ServerMonitor, PerformanceMonitor, SecurityMonitor, BusinessMonitor
+from .monitoring.security_monitor import _ip_key, _ip_str
+from .monitoring.server_monitor import LATENCY_BUCKETS, CachedServerMetrics, _latency_quantile
 from .analytics import DataProcessor, MetricsCalculator, ReportGenerator
 from .dashboards import RealtimeDashboard, BusinessDashboard, AdminDashboard
-from .alerts import AlertManager, TelegramChannel, EmailChannel
+from .alerts import AlertManager
 from .privacy import (
     PrivacyChecker, DataAnonymizer, GDPRCompliance,
-    AuditLogger, ConsentManager, DataRetentionManager, PrivacyPolicyManager,
+    AuditLogger, AuditEventType, AuditSeverity, anonymize_user_id, ConsentManager, DataRetentionManager, PrivacyPolicyManager,
     ConsentPurpose, ConsentMethod, DataCategory, RetentionPolicy
 )
 
@@ -48,6 +60,71 @@ class TestServerMonitor:
         
         # Проверяем, что мониторинг запустился
         assert not task.done() or task.cancelled()
+    
+    @pytest.mark.asyncio
+    async def test_latency_histogram_buckets(self):
+        """Тест гистограммы латентности: корзина b — [2**b, 2**(b+1)) мс, крайние значения в крайних корзинах"""
+        monitor = ServerMonitor()
+        with patch.object(settings, "USE_MOCK_METRICS", True):
+            for latency in (100.0, 127.9, 128.0, 0.5, 1e12):
+                with patch("random.uniform", return_value=latency):
+                    await monitor.test_latency("server_1")
+        
+        hist = monitor._latency_hist["server_1"]
+        assert len(hist) == LATENCY_BUCKETS
+        assert hist[6] == 2
+        assert hist[7] == 1
+        assert hist[0] == 1
+        assert hist[LATENCY_BUCKETS - 1] == 1
+        assert sum(hist) == 5
+    
+    def test_latency_quantile_single_bucket(self):
+        """Тест квантилей: все замеры в одной корзине дают ее верхнюю границу"""
+        hist = array.array("Q", [0] * LATENCY_BUCKETS)
+        hist[6] = 5
+        
+        for q in (0.5, 0.95, 0.99):
+            assert _latency_quantile(hist, 5, q) == 128.0
+    
+    def test_latency_quantile_spread(self):
+        """Тест квантилей по нескольким корзинам"""
+        hist = array.array("Q", [0] * LATENCY_BUCKETS)
+        hist[5] = 90
+        hist[8] = 9
+        hist[10] = 1
+        
+        assert _latency_quantile(hist, 100, 0.5) == 64.0
+        assert _latency_quantile(hist, 100, 0.95) == 512.0
+        assert _latency_quantile(hist, 100, 0.99) == 512.0
+        assert _latency_quantile(hist, 100, 1.0) == 2048.0
+    
+    @pytest.mark.asyncio
+    async def test_quality_metrics_empty_histogram(self):
+        """Тест метрик качества без замеров: квантили равны нулю"""
+        monitor = ServerMonitor()
+        with patch.object(settings, "USE_MOCK_METRICS", False):
+            metrics = await monitor.get_quality_metrics("unknown_server")
+        
+        assert "unknown_server" not in monitor._latency_hist
+        assert metrics["latency_p50_ms"] == 0.0
+        assert metrics["latency_p95_ms"] == 0.0
+        assert metrics["latency_p99_ms"] == 0.0
+    
+    def test_server_status_boundaries(self):
+        """Тест статуса по индексу здоровья: выше 70 — online, выше 40 — warning"""
+        monitor = ServerMonitor()
+        monitor.metrics_cache["server_1"] = CachedServerMetrics(
+            server_id="server_1", ts_ns=0, timestamp=datetime.utcnow(), cpu=0.0, mem=0.0,
+            disk=0.0, latency=0.0, err=0.0, conns=0, bw_gb=0.0, payload_bytes=b""
+        )
+        expected = {
+            0.0: "critical", 10.0: "critical", 40.0: "critical", 40.01: "warning",
+            70.0: "warning", 70.01: "online", 100.0: "online"
+        }
+        
+        for score, status in expected.items():
+            with patch.object(monitor, "get_server_health_score", return_value=score):
+                assert monitor.get_server_summary("server_1")["status"] == status, score
 
 
 class TestPerformanceMonitor:
@@ -78,6 +155,62 @@ class TestPerformanceMonitor:
         
         assert "payment_gateway:timeout" in monitor.metrics["error_rates"]
         assert monitor.metrics["error_rates"]["payment_gateway:timeout"] == 1
+    
+    def test_request_buffer_wraps_around(self):
+        """Тест кольцевого буфера: при переполнении новые записи заменяют самые старые"""
+        with patch.object(PerformanceMonitor, "REQUEST_BUFFER_SIZE", 4):
+            monitor = PerformanceMonitor()
+            for ms in range(1, 7):
+                monitor.record_request_time(ms / 1000)
+        
+        assert monitor._rt_count == 4
+        assert monitor._rt_head == 2
+        assert sorted(monitor._rt_buf.tolist()) == [3_000_000, 4_000_000, 5_000_000, 6_000_000]
+    
+    @pytest.mark.asyncio
+    async def test_response_time_window(self):
+        """Тест оконных расчетов: среднее за час и запросы в секунду за минуту"""
+        monitor = PerformanceMonitor()
+        for seconds in (0.1, 0.2, 0.3):
+            monitor.record_request_time(seconds)
+        
+        assert await monitor.calculate_avg_response_time() == 200.0
+        assert await monitor.calculate_rps() == 0.05
+        
+        # Запись двухчасовой давности выпадает из обоих окон
+        monitor._rt_ts[0] = time.monotonic_ns() - 7_200_000_000_000
+        assert await monitor.calculate_avg_response_time() == 250.0
+        assert await monitor.calculate_rps() == 0.03
+    
+    @pytest.mark.asyncio
+    async def test_schema_fast_path_and_fallback(self):
+        """Тест проверки по схеме: совпавшие метрики минуют полный обход, остальные проходят его"""
+        monitor = PerformanceMonitor()
+        assert await monitor._schema_is_private()
+        
+        validate = AsyncMock(return_value=True)
+        with patch.object(monitor.privacy_checker, "validate_metrics", validate), \
+                patch.object(monitor, "store_performance_metrics", AsyncMock()):
+            await monitor.collect_performance_metrics()
+            assert validate.await_count == 0
+            assert monitor.cache_stats()["schema_hits"] == 1
+            
+            # Новый ключ вне схемы: метрики не отбрасываются, а идут на полную проверку
+            with patch.object(monitor, "get_application_metrics", AsyncMock(return_value={"new_metric": 1.0})):
+                await monitor.collect_performance_metrics()
+            assert validate.await_count == 1
+            assert monitor.cache_stats()["schema_misses"] == 1
+            assert (await monitor.get_performance_summary())["status"] == "ok"
+        await monitor.stop()
+    
+    @pytest.mark.asyncio
+    async def test_response_time_empty_buffer(self):
+        """Тест расчетов на пустом буфере"""
+        monitor = PerformanceMonitor()
+        
+        assert await monitor.calculate_avg_response_time() == 0.0
+        assert await monitor.calculate_rps() == 0.0
+        assert await monitor.calculate_error_rate() == 0.0
 
 
 class TestSecurityMonitor:
@@ -114,6 +247,100 @@ class TestSecurityMonitor:
         await monitor.check_failed_logins()
         
         # В реальном тесте здесь должна быть проверка на срабатывание алерта
+    
+    def test_ip_keys_do_not_collide(self):
+        """Тест ключей IP: IPv4 и IPv6 с одинаковым числом различаются, строка восстанавливается"""
+        assert _ip_key("0.0.0.1") != _ip_key("::1")
+        for ip in ("0.0.0.1", "::1", "192.168.1.100", "2001:db8::1"):
+            assert _ip_str(_ip_key(ip)) == ip
+        assert _ip_key("not an ip") is None
+        assert _ip_key("1") is None
+    
+    def test_failed_login_users_anonymized_and_bounded(self):
+        """Тест учета по пользователю: логины анонимизируются, таблица ограничена"""
+        monitor = SecurityMonitor()
+        monitor.FAILED_USER_LIMIT = 3
+        for i in range(5):
+            monitor.record_failed_login("10.0.0.1", f"user{i}@example.com")
+        
+        assert list(monitor.failed_by_user) == [
+            anonymize_user_id(f"user{i}@example.com") for i in (2, 3, 4)
+        ]
+        assert not any("@" in user for user in monitor.failed_by_user)
+    
+    def test_decay_half_life(self):
+        """Тест полиномиального затухания: половина счета за τ·0.5**δ, ноль за τ"""
+        lifetime, shape = SecurityMonitor.FAILED_LOGIN_DECAY
+        
+        assert SecurityMonitor._decay(10.0, 0.0, SecurityMonitor.FAILED_LOGIN_DECAY) == 10.0
+        assert SecurityMonitor._decay(10.0, lifetime * 0.5 ** shape,
+                                      SecurityMonitor.FAILED_LOGIN_DECAY) == pytest.approx(5.0)
+        assert SecurityMonitor._decay(10.0, lifetime, SecurityMonitor.FAILED_LOGIN_DECAY) == 0.0
+        
+        lifetime, shape = SecurityMonitor.PRIVILEGE_DECAY
+        assert SecurityMonitor._decay(4.0, lifetime * 0.5 ** shape,
+                                      SecurityMonitor.PRIVILEGE_DECAY) == pytest.approx(2.0)
+    
+    def test_decayed_scores_pruned_below_floor(self):
+        """Тест очистки: угасшие ниже FAILED_SCORE_FLOOR записи удаляются при чтении"""
+        monitor = SecurityMonitor()
+        monitor.record_failed_login("10.0.0.1")
+        monitor.record_failed_login("10.0.0.2")
+        
+        # Оба IP обновлялись половину времени жизни назад: счета падают вдвое,
+        # 0.8 -> 0.4 уходит ниже порога 0.5, а 2 -> 1 остается
+        lifetime, shape = SecurityMonitor.FAILED_LOGIN_DECAY
+        past = time.monotonic() - lifetime * 0.5 ** shape
+        low, high = list(monitor.failed_scores)
+        monitor.failed_scores[low] = (0.8, past)
+        monitor.failed_scores[high] = (2.0, past)
+        
+        scores = monitor._decayed_failed_scores()
+        
+        assert list(scores) == [high]
+        assert scores[high] == pytest.approx(1.0, abs=1e-3)
+        assert list(monitor.failed_scores) == [high]
+    
+    @pytest.mark.asyncio
+    async def test_security_events_batch_flush(self, tmp_path):
+        """Тест пакетной записи событий: очередь сбрасывается в базу пакетами"""
+        with patch.object(settings, "SECURITY_EVENTS_DB", str(tmp_path / "events.db")):
+            monitor = SecurityMonitor()
+            for i in range(250):
+                await monitor.store_security_events({"timestamp": f"t{i}", "threat_detection": {"threat_level": i}})
+            await monitor.flush_security_events()
+            
+            assert len(monitor.security_events) == 250
+            events = await monitor.get_recent_security_events(limit=2)
+            assert [event["timestamp"] for event in events] == ["t248", "t249"]
+            await monitor.stop()
+    
+    @pytest.mark.asyncio
+    async def test_security_events_written_in_background(self, tmp_path):
+        """Тест фоновой записи: пакет закрывается по истечении ожидания без flush"""
+        with patch.object(settings, "SECURITY_EVENTS_DB", str(tmp_path / "events.db")):
+            monitor = SecurityMonitor()
+            monitor.EVENT_BATCH_WAIT = 0.05
+            await monitor.store_security_events({"timestamp": "t0"})
+            await asyncio.sleep(0.3)
+            
+            assert len(monitor.security_events) == 1
+            await monitor.stop()
+    
+    @pytest.mark.asyncio
+    async def test_repeated_security_events_collapsed(self, tmp_path):
+        """Тест повторов: одинаковые события пишутся одной сводной записью"""
+        with patch.object(settings, "SECURITY_EVENTS_DB", str(tmp_path / "events.db")):
+            monitor = SecurityMonitor()
+            for i in range(3):
+                await monitor.store_security_events({"timestamp": f"t{i}"})
+            await monitor.stop()
+            
+            events = await monitor.get_recent_security_events()
+            assert events == [
+                {"timestamp": "t0"},
+                {"timestamp": "t2", "repeat_of": "t0", "repeat_count": 2}
+            ]
 
 
 class TestBusinessMonitor:
@@ -541,16 +768,19 @@ class TestAuditLogger:
         logger = AuditLogger()
         
         event_id = await logger.log_event(
-            "data_access",
+            AuditEventType.DATA_ACCESS,
             "Access to user data",
             "user123",
             "user_profile",
-            "medium"
+            AuditSeverity.MEDIUM
         )
+        # Запись в лог асинхронная: дописываем очередь перед проверкой
+        await logger.flush()
         
         assert event_id != ""
         assert len(logger.audit_log) == 1
-        assert logger.audit_log[0]["event_type"] == "data_access"
+        assert logger.audit_log[0].to_dict()["event_type"] == "data_access"
+        await logger.stop()
     
     @pytest.mark.asyncio
     async def test_log_data_access(self):
@@ -563,34 +793,82 @@ class TestAuditLogger:
             ["personal_data"],
             "analytics"
         )
+        await logger.flush()
         
         assert event_id != ""
         assert len(logger.audit_log) == 1
-        assert logger.audit_log[0]["event_type"] == "data_access"
+        assert logger.audit_log[0].to_dict()["event_type"] == "data_access"
+        await logger.stop()
     
-    def test_get_audit_log(self):
+    @pytest.mark.asyncio
+    async def test_get_audit_log(self):
         """Тест получения лога аудита"""
         logger = AuditLogger()
         
         # Добавляем тестовые события
-        logger.audit_log = [
-            {
-                "event_type": "data_access",
-                "timestamp": datetime.utcnow().isoformat(),
-                "user_id": "user123"
-            },
-            {
-                "event_type": "data_modification",
-                "timestamp": datetime.utcnow().isoformat(),
-                "user_id": "user456"
-            }
-        ]
+        await logger.log_data_access("user_profile", "user123")
+        await logger.log_data_modification("user_profile", "user456")
         
-        # Фильтруем по типу события
-        filtered_log = await logger.get_audit_log(event_type="data_access")
+        # Фильтруем по типу события: чтение само дописывает очередь
+        filtered_log = await logger.get_audit_log(event_type=AuditEventType.DATA_ACCESS)
         
         assert len(filtered_log) == 1
         assert filtered_log[0]["event_type"] == "data_access"
+        await logger.stop()
+    
+    @pytest.mark.asyncio
+    async def test_log_event_after_stop(self):
+        """Тест: после остановки события не принимаются"""
+        logger = AuditLogger()
+        await logger.stop()
+        
+        event_id = await logger.log_data_access("user_profile", "user123")
+        
+        assert event_id == ""
+        assert len(await logger.get_audit_log()) == 0
+    
+    @pytest.mark.asyncio
+    async def test_export_csv_round_trip(self):
+        """Тест CSV-экспорта: разбор файла возвращает те же события"""
+        logger = AuditLogger()
+        await logger.log_event(
+            AuditEventType.DATA_ACCESS,
+            'Доступ, с "кавычками"\nи переводом строки',
+            "user123",
+            "user_profile",
+            AuditSeverity.MEDIUM,
+            {"purpose": "analytics", "categories": ["a", "b"]}
+        )
+        await logger.log_data_deletion("user_profile", "user456")
+        
+        exported = await logger.export_audit_log(format="csv")
+        rows = list(csv.DictReader(io.StringIO(exported, newline="")))
+        events = await logger.get_audit_log()
+        
+        assert len(rows) == len(events) == 2
+        for row, event in zip(rows, events):
+            assert json.loads(row.pop("metadata")) == event["metadata"]
+            for field, value in row.items():
+                assert value == ("" if event[field] is None else str(event[field])), field
+        await logger.stop()
+    
+    @pytest.mark.asyncio
+    async def test_export_compressed(self):
+        """Тест сжатого экспорта: после распаковки совпадает с обычным"""
+        logger = AuditLogger()
+        for i in range(50):
+            await logger.log_data_access(f"resource_{i}", "user123", ["analytics_data"], "reporting")
+        
+        for export_format in ("json", "csv"):
+            plain = await logger.export_audit_log(format=export_format)
+            compressed = await logger.export_audit_log(format=export_format, compress=True)
+            
+            assert isinstance(compressed, bytes)
+            assert gzip.decompress(compressed).decode() == plain
+            assert len(compressed) < len(plain.encode())
+        
+        assert len(json.loads(await logger.export_audit_log())) == 50
+        await logger.stop()
 
 
 class TestPrivacyPolicyManager:
@@ -698,6 +976,8 @@ class TestIntegration:
         # 6. Логируем аудит
         await audit_logger.log_data_access("analytics", "user123", ["analytics_data"], "reporting")
         
+        await audit_logger.flush()
+        
         # Проверяем результаты
         assert len(aggregated_data) >= 0
         assert isinstance(kpis, dict)